@@ -1,35 +1,66 @@
 import sqlite3
 
-from typing import Optional
+from collections import OrderedDict
+from typing import Any, Optional
 from flask import current_app as app
+from werkzeug.local import LocalProxy
 
-logger = app.logger
+import queries
+from codes import CodeAllocator
+
+# логгер приложения берется лениво, т.к. модуль импортируется до создания контекста приложения
+logger = LocalProxy(lambda: app.logger)
+# выдача кодов книг текущего приложения (создается в create_app)
+allocator: CodeAllocator = LocalProxy(lambda: app.extensions['code_allocator'])
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш: при переполнении вытесняется давно не использованная запись"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.__data: OrderedDict[Any, Any] = OrderedDict()
+
+    def get(self, key: Any) -> Any:
+        try:
+            self.__data.move_to_end(key)
+        except KeyError:
+            return None
+        return self.__data[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        self.__data[key] = value
+        self.__data.move_to_end(key)
+        while len(self.__data) > self.maxsize:
+            self.__data.popitem(last=False)
+
+
+# ключ первой страницы очереди обращений (больше любого id)
+FEEDBACK_FIRST_PAGE = 2 ** 63 - 1
+# фильтры очереди обращений по статусу
+FEEDBACK_STATUSES = ('open', 'closed', 'all')
+
+# записи книг (код, название, автор, жанр, год издания, владелец) по (полка, id книги), общие для запросов воркера.
+# Кэш свой у каждого приложения (создается в create_app). Приложение не изменяет записи книг после добавления,
+# поэтому кэш не сбрасывается
+book_cache: LRUCache = LocalProxy(lambda: app.extensions['book_cache'])
 
 
 class FDataBase:
-    def __init__(self, db: sqlite3.Connection) -> None:
+    def __init__(self, db: sqlite3.Connection, db_ro: Optional[sqlite3.Connection] = None,
+                 shelf: Optional[str] = None) -> None:
+        """
+        :param db: соединение с БД на чтение и запись (для изменяющих методов),
+        db_ro: соединение с БД только на чтение (для методов отображения страниц), 
+        если не передано - чтение идет через db,
+        shelf: полка, к БД которой относятся соединения (None, если полка одна, см. shelves.py)
+        """
         self.__db = db
-        self.__cur = db.cursor()    
+        self.__shelf = shelf
+        self.__cur = db.cursor()
+        # курсор для чтения: отдельное read-only соединение не конкурирует с блокировками записи
+        self.__ro_cur = db_ro.cursor() if db_ro is not None else self.__cur
         
-    def __getBookCode(self, book_id: int) -> tuple[int] | None:
-        """
-        Возвращает код книги по ее идентификатору
-
-        :param book_id: идентификатор книги
-        :return: кортеж с информацией о книге (код книги) или None
-        """       
-        try:
-            # Передаем book_id в метод execute() в виде кортежа
-            self.__cur.execute("SELECT code FROM books WHERE id = ? and is_on = 1", (book_id,))
-            res = self.__cur.fetchone()
-            
-            if res: 
-                logger.info(f'Успешно получен код {res} для книги с id#{book_id}')                
-                return res
-        except sqlite3.Error as err:
-            logger.error(f'Ошибка получения кода книги по ИД из БД - {str(err)}')            
-        return ()
-    
     def __getBookId(self, book_code: int) -> tuple[int]:
         """
         Возвращает идентификатор книги по коду
@@ -39,8 +70,7 @@ class FDataBase:
         """       
         try:
             # Передаем book_code в метод execute() в виде кортежа
-            self.__cur.execute("SELECT id FROM books WHERE code = ? and is_on = 1", (book_code,))
-            res = self.__cur.fetchone()
+            res = queries.fetchone(self.__cur, 'book_id', (book_code,))
             if res: 
                 logger.info(f'Успешно получен ID#{res} для книги с кодом {book_code}')                
                 return res
@@ -55,8 +85,7 @@ class FDataBase:
         :return: список кортежей с пунктами главноего меню или пустой список
         """        
         try:
-            self.__cur.execute('SELECT * FROM mainmenu')
-            res = self.__cur.fetchall()
+            res = queries.fetchall(self.__ro_cur, 'menu')
             if res: 
                 logger.info(f'Успешно получен список верхнего меню для сайта')
                 return res
@@ -72,9 +101,7 @@ class FDataBase:
         :return: кортеж (true/false, кол-во добавленных строк или описание ошибки)
         """
         try:            
-            self.__cur.execute("INSERT INTO users(email) VALUES(?)", \
-                               (email,))
-            rows = self.__cur.rowcount
+            rows = queries.execute(self.__cur, 'add_user', (email,)).rowcount
             self.__db.commit()
             logger.info(f'Успешно добавлен новый пользователь {email} в БД')
         except sqlite3.Error as err:            
@@ -82,6 +109,23 @@ class FDataBase:
             return (False, str(err))
         return (True, rows)
     
+    def registerUser(self, email: str) -> tuple[bool, int | str]:
+        """
+        Добавляет пользователя в БД полки, если его там еще нет
+
+        :param: email:  адрес эл. почты
+        :return: кортеж (true/false, кол-во добавленных строк или описание ошибки)
+        """
+        try:            
+            rows = queries.execute(self.__cur, 'register_user', {'email': email}).rowcount
+            self.__db.commit()
+            if rows > 0:
+                logger.info(f'Пользователь {email} зарегистрирован на полке {self.__shelf}')
+        except sqlite3.Error as err:            
+            logger.error(f'Ошибка при регистрации пользователя {email} на полке {self.__shelf} - {str(err)}')   
+            return (False, str(err))
+        return (True, rows)
+    
     def getUser(self, email: str) -> tuple[int, int]:
         """
         Возвращает информацию о пользователе по его email
@@ -90,8 +134,7 @@ class FDataBase:
         :return: кортеж (id пользователя, принадлежность к администратору(0 | 1))
         """        
         try:
-            self.__cur.execute("SELECT id, is_admin FROM users WHERE email = ? AND is_on = 1", (email,))
-            res = self.__cur.fetchone()
+            res = queries.fetchone(self.__cur, 'user', (email,))
             if res: 
                 logger.info(f'Успешно получены данные по пользователю {email} из БД')
                 return res            
@@ -108,18 +151,17 @@ class FDataBase:
         :return: кортеж с информацией о добавленной книге (статус добавления(True/False), код книги)
         """
         try: 
-            self.__cur.execute("INSERT INTO books(title, author, genre_id, public_year, owner_id) VALUES(?, ?, ?, ?, ?)", 
-                            (title, author, genre_id, year, user_id))
-            book_id = self.__cur.lastrowid
+            # код выдается из зарезервированного воркером блока, поэтому читать его из БД после вставки не нужно
+            book_code = allocator.allocate(self.__db, self.__shelf)
+            book_id = queries.execute(self.__cur, 'add_book', 
+                                      (book_code, title, author, genre_id, year, user_id)).lastrowid
             self.__db.commit()
-            book_code = self.__getBookCode(book_id)
-            if book_code: 
-                logger.info(f"Успешно добавлена книга (id: {book_id}, код: {book_code['code']}): {title}, {author}, {genre_id}, {year}. Пользователь: {user_id}")
-                return (True, book_code['code'])  
+            logger.info(f"Успешно добавлена книга (id: {book_id}, код: {book_code}): {title}, {author}, {genre_id}, {year}. Пользователь: {user_id}")
         except sqlite3.Error as err:
             logger.error(f'Ошибка добавления книги ({title}, {author}, {genre_id}, {year}. '
                          f'Пользователь: {user_id}) в БД - {str(err)}')            
             return (False, str(err))
+        return (True, book_code)
     
     def takeBook(self, book_code: int, user_id: int) -> tuple[bool, int | str]:        
         """
@@ -133,24 +175,9 @@ class FDataBase:
             if not book_id:
                 return (False, f'В каталоге отсутствует книга с номером {book_code}. Проверьте и введите код еще раз.')            
             else: 
-                self.__cur.execute("""
-                -- Вставляем новую запись в таблицу forms с полями user_id, book_id и dt_take
-                INSERT INTO forms (user_id, book_id, dt_take)
-                -- Выбираем значения для вставки
-                SELECT :user_id, :book_id, datetime('now', 'localtime')
-                -- Проверяем, что в таблице forms нет записей с такими же значениями полей book_id и user_id,
-                -- удовлетворяющими условиям dt_take <= datetime('now') и dt_return > datetime('now')
-                WHERE NOT EXISTS (
-                    SELECT 1 FROM forms 
-                    WHERE (book_id = :book_id AND dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime'))
-                    OR (user_id = :user_id AND dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime'))
-                ) AND EXISTS (
-                    SELECT 1 FROM books 
-                    WHERE id = :book_id AND is_on = 1
-                );
-                """, 
-                {'book_id': book_id['id'], 'user_id': user_id})
-                rows = self.__cur.rowcount
+                # книга выдается, только если она не на руках и у читателя нет другой невозвращенной книги
+                rows = queries.execute(self.__cur, 'take_book',
+                                       {'book_id': book_id['id'], 'user_id': user_id}).rowcount
                 if rows <= 0:
                     logger.error(f'Ошибка выдачи книги #{book_code}.'
                                  f'Пользователь: id#{user_id}) в БД - описание ошибки: '
@@ -177,19 +204,8 @@ class FDataBase:
             if not book_id:
                 return (False, f'В каталоге отсутствует книга с номером {book_code}. Проверьте и введите код еще раз.')
             else:
-                self.__cur.execute("""
-                UPDATE forms 
-                SET dt_return = datetime('now', 'localtime')
-                WHERE user_id = :user_id 
-                AND book_id = :book_id
-                AND dt_return > datetime('now', 'localtime')
-                AND dt_take <= datetime('now', 'localtime')
-                AND dt_new > datetime('now', 'localtime')
-                AND dt_delete > datetime('now', 'localtime')
-                """, 
-                {'book_id': book_id['id'], 'user_id': user_id})
-
-                rows = self.__cur.rowcount
+                rows = queries.execute(self.__cur, 'return_book',
+                                       {'book_id': book_id['id'], 'user_id': user_id}).rowcount
                 if rows <= 0:
                     logger.error(f'Ошибка возврата книги #{book_code}.'
                                  f'Пользователь: id#{user_id}) в БД - описание ошибки: '
@@ -211,32 +227,9 @@ class FDataBase:
         :return: кортеж с информацией о подписке на книгу (статус добавления(True/False), )
         """
         try:            
-            
-            self.__cur.execute("""
-            -- Вставляем новую запись в таблицу subscriptions с полями user_id, book_id
-            INSERT INTO subscriptions (user_id, book_id)
-            -- Выбираем значения для вставки
-            SELECT :user_id, :book_id
-            -- Проверяем, что в таблице subscriptions нет записей с такими же значениями полей book_id и user_id,
-            -- удовлетворяющими условиям dt_take <= datetime('now') и dt_return > datetime('now')
-            WHERE NOT EXISTS (
-                SELECT 1 FROM subscriptions 
-                WHERE book_id = :book_id AND user_id = :user_id AND dt_new <= datetime('now', 'localtime') AND dt_delete > datetime('now', 'localtime')               
-            ) 
-            -- Проверяем, что в таблице forms есть записи с такими же значениями полей book_id и эта книга выдана, но не подписчику
-            AND EXISTS (
-                SELECT 1 FROM forms 
-                WHERE book_id = :book_id AND dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime')
-                AND user_id != :user_id                                    
-            )
-            -- Проверяем, что в таблице books есть записи с такими же значениями полей book_id и книга активна
-            AND EXISTS (
-                SELECT 1 FROM books 
-                WHERE id = :book_id AND is_on = 1)
-            """, 
-            {'book_id': book_id, 'user_id': user_id})
-
-            rows = self.__cur.rowcount
+            # подписка оформляется, только если книга выдана другому читателю и подписки еще нет
+            rows = queries.execute(self.__cur, 'subscribe_book',
+                                   {'book_id': book_id, 'user_id': user_id}).rowcount
             if rows <= 0:
                 return (False, f"вы уже подписаны на эту книгу (проверьте ваши подписки в личном кабинете).")
             self.__db.commit()                             
@@ -254,18 +247,8 @@ class FDataBase:
         :return: кортеж с информацией о подписке на книгу (статус добавления(True/False))
         """
         try:            
-            
-            self.__cur.execute("""
-            UPDATE subscriptions 
-            SET dt_delete = datetime('now', 'localtime')
-            WHERE user_id = :user_id 
-            AND book_id = :book_id
-            AND dt_new <= datetime('now', 'localtime')  
-            AND dt_delete > datetime('now', 'localtime')  
-            """, 
-            {'book_id': book_id, 'user_id': user_id})
-
-            rows = self.__cur.rowcount
+            rows = queries.execute(self.__cur, 'unsubscribe_book',
+                                   {'book_id': book_id, 'user_id': user_id}).rowcount
             if rows <= 0:
                 return (False, f"вы еще не подписаны на эту книгу (проверьте подписки в личном кабинете).")
             self.__db.commit()                             
@@ -288,10 +271,9 @@ class FDataBase:
     
         try: 
             if user_id:           
-                self.__cur.execute('SELECT * FROM vw_open_subs_wide WHERE user_id = ?', (user_id,))
+                res = queries.fetchall(self.__ro_cur, 'user_subscriptions', (user_id,))
             else:
-                self.__cur.execute('SELECT * FROM vw_open_subs_wide')
-            res = self.__cur.fetchall()
+                res = queries.fetchall(self.__ro_cur, 'subscriptions')
             if res: return res
         except sqlite3.Error as err:
             print(f'Ошибка чтения оформленных подписок из БД - {str(err)}')
@@ -304,34 +286,77 @@ class FDataBase:
         :return: кортеж (id правила, описание правила)
         """    
         try: 
-            self.__cur.execute('SELECT * FROM rules WHERE is_on = 1')
-            res = self.__cur.fetchall()
+            res = queries.fetchall(self.__ro_cur, 'rules')
             if res: return res
         except sqlite3.Error as err:
             print(f'Ошибка чтении свода правил проекта из БД - {str(err)}')
         return []  
     
     
-    def getBook(self, book_id: int) -> tuple[int, str, str, str, int]:
+    def getBook(self, book_id: int) -> tuple[int, str, str, str, int, str]:
         """
-        Возвращает информацию о книге по ее идентификатору
+        Возвращает информацию о книге по ее идентификатору (из кэша книг, если она там есть)
 
         :param book_id: идентификатор книги
-        :return: кортеж с информацией о книге (код, название, автор, жанр, год издания)
+        :return: кортеж с информацией о книге (код, название, автор, жанр, год издания, владелец)
         """
-        # Параметризованный запрос с использованием знака вопроса вместо book_id
-        sql = (f"SELECT t1.code, t1.title, t1.author, g.genre, t1.public_year \n" 
-              f"FROM books as t1 JOIN genres as g ON t1.genre_id = g.id \n"
-              f"WHERE t1.id = ?")
+        res = book_cache.get((self.__shelf, book_id))
+        if res: return res
         try:
             # Передаем book_id в метод execute() в виде кортежа
-            self.__cur.execute(sql, (book_id,))
-            res = self.__cur.fetchone()            
-            if res: return res
+            res = queries.fetchone(self.__ro_cur, 'book', (book_id,))
+            if res: 
+                book_cache.put((self.__shelf, book_id), res)
+                return res
         except sqlite3.Error as err:
             print(f'Ошибка чтения книги из БД - {str(err)}')
         return ()
     
+    def getBookHolder(self, book_id: int) -> tuple[int, int, str, str, str, int, int, str, str, str]:
+        """
+        Возвращает информацию о читателе, у которого книга сейчас на руках
+        
+        :param book_id: идентификатор книги
+        :return: кортеж (код книги, id книги, название книги, автор книги, жанр, год издания, 
+        id пользователя(взявшего книгу), имя пользователя, дата и время выдачи книги, дата и время срока возврата) 
+        или пустой кортеж, если книга на полке
+        """
+        try:
+            res = queries.fetchone(self.__ro_cur, 'book_holder', (book_id,))
+            if res: return res
+        except sqlite3.Error as err:
+            print(f'Ошибка чтения текущего читателя книги из БД - {str(err)}')
+        return ()
+    
+    def getBookHistory(self, book_id: int) -> list[tuple[int, int, str, str, int, int, str, str, str]]:
+        """
+        Возвращает историю выдачи и возврата книги
+        
+        :param book_id: идентификатор книги
+        :return: кортеж (код книги, id книги, название книги, автор книги, год издания, 
+        id пользователя, имя пользователя, тип операции, дата и время операции
+        """
+        try:
+            res = queries.fetchall(self.__ro_cur, 'book_history', (book_id,))
+            if res: return res
+        except sqlite3.Error as err:
+            print(f'Ошибка чтения истории книги из БД - {str(err)}')
+        return []
+    
+    def getBookSubscribersCount(self, book_id: int) -> int:
+        """
+        Возвращает кол-во открытых подписок на книгу
+        
+        :param book_id: идентификатор книги
+        :return: кол-во подписчиков
+        """
+        try:
+            res = queries.fetchone(self.__ro_cur, 'book_subscribers', (book_id,))
+            if res: return res['cnt']
+        except sqlite3.Error as err:
+            print(f'Ошибка чтения кол-ва подписчиков книги из БД - {str(err)}')
+        return 0
+    
     
     def getAvailableBooks(self) -> list[tuple[int, str, str, str, int, str, str]]:
         """
@@ -342,8 +367,7 @@ class FDataBase:
         """
         
         try:            
-            self.__cur.execute('SELECT * FROM vw_available_books')
-            res = self.__cur.fetchall()
+            res = queries.fetchall(self.__ro_cur, 'available_books')
             if res: return res
         except sqlite3.Error as err:
             print(f'Ошибка чтения списка доступных книг из БД - {str(err)}')
@@ -360,18 +384,9 @@ class FDataBase:
     
         try: 
             if for_lk:           
-                self.__cur.execute('SELECT * FROM vw_taken_books WHERE user_id = ?', (user_id,))
+                res = queries.fetchall(self.__ro_cur, 'user_taken_books', (user_id,))
             else:
-                self.__cur.execute("""
-                SELECT tb.*, 
-                    CASE WHEN s.subs_book_id IS NULL THEN 0
-                    ELSE 1
-                    END AS subs_status
-                FROM vw_taken_books as tb
-                LEFT JOIN vw_open_subs_trim as s ON tb.book_id = s.subs_book_id
-                AND s.subs_user_id = :user_id
-                """, {'user_id': user_id})
-            res = self.__cur.fetchall()
+                res = queries.fetchall(self.__ro_cur, 'taken_books', {'user_id': user_id})
             if res: return res
         except sqlite3.Error as err:
             print(f'Ошибка чтения списка выданных книг из БД - {str(err)}')
@@ -388,10 +403,9 @@ class FDataBase:
     
         try: 
             if user_id:           
-                self.__cur.execute('SELECT * FROM vw_book_log WHERE user_id = ?', (user_id,))
+                res = queries.fetchall(self.__ro_cur, 'user_book_log', (user_id,))
             else:
-                self.__cur.execute('SELECT * FROM vw_book_log')
-            res = self.__cur.fetchall()
+                res = queries.fetchall(self.__ro_cur, 'book_log')
             if res: return res
         except sqlite3.Error as err:
             print(f'Ошибка чтения списка операций(лога) из БД - {str(err)}')
@@ -405,8 +419,7 @@ class FDataBase:
         (id жанра, название жанра)
         """   
         try:            
-            self.__cur.execute("SELECT id, genre FROM genres WHERE is_on = 1")
-            res = self.__cur.fetchall()
+            res = queries.fetchall(self.__ro_cur, 'genres')
             if res: return res
         except sqlite3.Error as err:
             print(f'Ошибка чтения списка жанров из БД - {str(err)}')
@@ -420,9 +433,7 @@ class FDataBase:
         :return: кортеж (статус добавления(True/False), id обращения)
         """
         try:                                
-            self.__cur.execute("INSERT INTO feedbacks(msg, user_id) VALUES(?, ?)", 
-                            (msg, user_id))
-            feedback_id = self.__cur.lastrowid
+            feedback_id = queries.execute(self.__cur, 'add_feedback', (msg, user_id)).lastrowid
             self.__db.commit()            
         except sqlite3.Error as err:
             print(f'Ошибка при добавлении обращения ТП в БД - {str(err)}')
@@ -438,17 +449,7 @@ class FDataBase:
         кол-во закрытых обращений)
         """
         try:            
-            
-            self.__cur.execute("""
-            UPDATE feedbacks 
-            SET dt_delete = datetime('now', 'localtime')
-            WHERE id = :fb_id
-            AND dt_new <= datetime('now', 'localtime')  
-            AND dt_delete > datetime('now', 'localtime')    
-            """, 
-            {'fb_id': fb_id})
-
-            rows = self.__cur.rowcount
+            rows = queries.execute(self.__cur, 'close_feedback', {'fb_id': fb_id}).rowcount
             if rows <= 0:
                 return (False, f"отсутствует обращение с таким id или оно уже закрыто")
             self.__db.commit()                             
@@ -458,20 +459,61 @@ class FDataBase:
             return (False, str(err))
         return (True, rows) 
     
-    def getAllFeedbacks(self) -> list[tuple[int, str, str, str, str]]:
+    def getFeedbacks(self, status: str = 'open', user_id: int = 0, before: int = 0, 
+                     limit: int = 50) -> list[tuple[int, str, str, str, str, int]]:
         """
-        Возвращает информацию обо всех обращениях пользователей
+        Возвращает страницу обращений пользователей, от новых к старым
         
-        :return: кортеж (id обращения, текст сообщения, email пользователя, дата обращения, 
-        тип последнего события, связанного с обращением)
+        :param status: 'open' | 'closed' | 'all' - фильтр по статусу (для очереди администратора),
+        user_id: id пользователя - только его обращения в любом статусе (фильтр status не применяется),
+        before: id обращения, после которого начинается страница (0 - первая страница), limit: размер страницы
+        :return: кортеж (id обращения, email пользователя, текст сообщения, дата обращения, 
+        дата закрытия, признак закрытия(0 | 1))
         """        
+        if status not in FEEDBACK_STATUSES:
+            status = 'open'
+        params = {'before': before or FEEDBACK_FIRST_PAGE, 'limit': limit}
         try:            
-            self.__cur.execute('SELECT * FROM vw_feedbacks')
-            res = self.__cur.fetchall() 
+            if user_id:
+                res = queries.fetchall(self.__ro_cur, 'user_feedbacks', {**params, 'user_id': user_id})
+            else:
+                res = queries.fetchall(self.__ro_cur, f'feedbacks_{status}', params)
             if res: return res           
         except sqlite3.Error as err:
-            print(f'Ошибка чтения списка меню из БД - {str(err)}')            
+            print(f'Ошибка чтения списка обращений из БД - {str(err)}')            
         return []
 
+    def addVerifyCode(self, email: str, code_hash: str, ttl: int) -> tuple[bool, int | str]:
+        """
+        Сохраняет код подтверждения входа (заменяет ранее выданный код пользователя), удаляет истекшие коды
 
-    
+        :params email: адрес эл. почты, code_hash: хэш кода подтверждения, ttl: срок действия кода в секундах
+        :return: кортеж (статус сохранения(True/False), кол-во сохраненных кодов или описание ошибки)
+        """
+        try:
+            queries.execute(self.__cur, 'purge_verify_codes')
+            rows = queries.execute(self.__cur, 'add_verify_code',
+                                   {'email': email, 'code_hash': code_hash, 'ttl': f'+{int(ttl)} seconds'}).rowcount
+            self.__db.commit()
+        except sqlite3.Error as err:
+            logger.error(f'Ошибка сохранения кода подтверждения для {email} в БД - {str(err)}')
+            return (False, str(err))
+        return (True, rows)
+
+    def checkVerifyCode(self, email: str, code_hash: str, max_attempts: int) -> bool:
+        """
+        Проверяет и погашает код подтверждения входа, неудачная попытка увеличивает счетчик попыток
+
+        :params email: адрес эл. почты, code_hash: хэш введенного кода, max_attempts: допустимое кол-во попыток ввода
+        :return: True, если код верный, не истек и попытки не исчерпаны
+        """
+        try:
+            rows = queries.execute(self.__cur, 'use_verify_code',
+                                   {'email': email, 'code_hash': code_hash, 'max_attempts': max_attempts}).rowcount
+            if rows <= 0:
+                queries.execute(self.__cur, 'fail_verify_code', (email,))
+            self.__db.commit()
+            return rows > 0
+        except sqlite3.Error as err:
+            logger.error(f'Ошибка проверки кода подтверждения для {email} в БД - {str(err)}')
+        return False
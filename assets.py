@@ -0,0 +1,147 @@
+"""
+Статические файлы с отпечатком содержимого и сжатие ответов.
+
+Сборка (python assets.py) копирует файлы из static/ в static/dist/ с хэшем содержимого
+в имени (css/styles.css -> dist/css/styles.3f2a9c1b7e4d.css), рядом кладет сжатые
+варианты .gz (и .br, если установлен пакет brotli) и manifest.json с соответствием имен.
+
+Сборка выполняется только отдельно (в Dockerfile или вручную), а не при запуске приложения:
+uWSGI может в это же время отдавать файлы из static/dist через static-map.
+
+После init_assets(app):
+    - url_for('static', filename='css/styles.css') возвращает адрес файла с отпечатком,
+      поэтому шаблоны не меняются, а новый файл после правки получает новый адрес
+      (без сборки и в режиме отладки - обычный адрес static/css/styles.css);
+    - файлы из dist/ отдаются с Cache-Control на год (immutable) и в сжатом варианте,
+      если клиент его принимает (в uwsgi.ini то же самое делает static-map без Python);
+    - HTML-ответы больше GZIP_MIN_SIZE байт сжимаются gzip на лету.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from flask import Flask, Response, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# типы файлов, которые имеет смысл сжимать (картинки png уже сжаты)
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.ico')
+# кэширование файлов с отпечатком - год, их содержимое по этому адресу никогда не меняется
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+
+def build(static_dir: str) -> dict[str, str]:
+    """
+    Собирает файлы с отпечатком содержимого и их сжатые варианты в static_dir/dist
+
+    :param static_dir: каталог статических файлов
+    :return: манифест {исходное имя: имя с отпечатком} относительно static_dir
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir and DIST_DIR in dirs:
+            dirs.remove(DIST_DIR)
+        for name in files:
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, static_dir).replace(os.sep, '/')
+            with open(src, 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(rel)
+            hashed = f'{DIST_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            dst = os.path.join(static_dir, hashed)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, 'wb') as f:
+                f.write(data)
+            if ext.lower() in COMPRESSIBLE:
+                with open(f'{dst}.gz', 'wb') as f:
+                    f.write(gzip.compress(data, 9, mtime=0))
+                if brotli is not None:
+                    with open(f'{dst}.br', 'wb') as f:
+                        f.write(brotli.compress(data))
+            manifest[rel] = hashed
+    with open(os.path.join(dist_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+def load_manifest(static_dir: str) -> dict[str, str]:
+    """Читает манифест собранных файлов или пустой словарь, если сборки еще не было"""
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _accepts(encoding: str) -> bool:
+    # учитывается вес: "gzip;q=0" означает, что gzip клиент не принимает
+    return request.accept_encodings[encoding] > 0
+
+
+def init_assets(app: Flask) -> None:
+    """
+    Подключает статические файлы с отпечатком и сжатие HTML-ответов
+
+    :param app: приложение
+    """
+    static_dir = app.static_folder
+    # в режиме отладки собранные файлы не используются, чтобы правки сразу попадали на страницы
+    manifest = {} if app.debug else load_manifest(static_dir)
+    if not manifest and not app.debug:
+        app.logger.warning('Статические файлы не собраны (python assets.py), адреса без отпечатка')
+    min_size = app.config.get('GZIP_MIN_SIZE', 1024)
+    level = app.config.get('GZIP_LEVEL', 6)
+
+    @app.url_defaults
+    def fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.get(values['filename'], values['filename'])
+
+    def static(filename):
+        if not filename.startswith(f'{DIST_DIR}/'):
+            return app.send_static_file(filename)
+        path = os.path.join(static_dir, filename)
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if _accepts(encoding) and os.path.isfile(f'{path}{suffix}'):
+                # тип содержимого определяется по имени без суффикса: styles.css.gz -> text/css
+                response = send_from_directory(static_dir, f'{filename}{suffix}')
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(static_dir, filename)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static
+
+    @app.after_request
+    def compress(response: Response) -> Response:
+        if response.mimetype != 'text/html':
+            return response
+        # ответ зависит от Accept-Encoding, даже если сжат не был: иначе кэш отдаст
+        # несжатую копию клиенту с gzip или сжатую - клиенту без него
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.status_code != 200
+                or 'Content-Encoding' in response.headers or not _accepts('gzip')):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip.compress(data, level))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+
+if __name__ == '__main__':
+    for src, dst in build('static').items():
+        print(f'{src} -> {dst}')
@@ -0,0 +1,136 @@
+"""
+Выдача кодов книг.
+
+Код новой книги - порядковый номер из общего счетчика code_seq плюс контрольная цифра
+по алгоритму Дамма (ловит любую одиночную ошибку и перестановку соседних цифр при вводе).
+Длина кода не ограничена: номера начинаются с 10000, поэтому новые коды - от 6 цифр
+и не пересекаются со старыми 5-значными кодами без контрольной цифры.
+
+Каждый воркер резервирует в счетчике блок из block_size номеров одним коротким
+UPDATE и дальше выдает коды из блока без обращения к БД. Номера не используются
+повторно: неизрасходованный остаток блока при перезапуске воркера просто пропускается.
+У каждой полки (файла БД, см. shelves.py) свой счетчик, поэтому и блоки резервируются по полкам.
+Чтобы коды разных полок не совпадали, счетчик полки с номером N начинается с N * CODE_SPAN
+(полка 0 - исходная БД, с 10000), а граница диапазона полки хранится в code_seq.max_value:
+блок, который выходит за границу, не резервируется.
+"""
+import os
+import sqlite3
+
+import queries
+
+# таблица квазигруппы для алгоритма Дамма
+_DAMM = (
+    (0, 3, 1, 7, 5, 9, 8, 6, 4, 2),
+    (7, 0, 9, 2, 1, 5, 4, 8, 6, 3),
+    (4, 2, 0, 6, 8, 7, 1, 3, 5, 9),
+    (1, 7, 5, 0, 9, 8, 3, 4, 2, 6),
+    (6, 1, 2, 3, 0, 4, 5, 9, 7, 8),
+    (3, 6, 7, 4, 2, 0, 9, 5, 8, 1),
+    (5, 8, 6, 9, 7, 2, 0, 1, 3, 4),
+    (8, 9, 4, 5, 3, 6, 2, 0, 1, 7),
+    (9, 4, 3, 8, 6, 1, 7, 2, 0, 5),
+    (2, 5, 8, 1, 4, 3, 6, 7, 9, 0),
+)
+
+# длина старых кодов (без контрольной цифры)
+LEGACY_CODE_LENGTH = 5
+# кол-во номеров в диапазоне одной полки
+CODE_SPAN = 10 ** 6
+
+
+def _damm(digits: str) -> int:
+    interim = 0
+    for digit in digits:
+        interim = _DAMM[interim][int(digit)]
+    return interim
+
+
+def make_code(number: int) -> int:
+    """
+    Возвращает код книги для порядкового номера
+
+    :param number: порядковый номер из счетчика code_seq
+    :return: код книги (номер с контрольной цифрой в конце)
+    """
+    return number * 10 + _damm(str(number))
+
+
+def first_number(shelf_no: int) -> int:
+    """
+    Возвращает первый номер диапазона полки
+
+    :param shelf_no: номер полки (0 - исходная БД)
+    :return: начальное значение счетчика code_seq
+    """
+    return shelf_no * CODE_SPAN if shelf_no else 10000
+
+
+def max_number(shelf_no: int) -> int:
+    """
+    Возвращает границу диапазона полки (первый номер следующей полки)
+
+    :param shelf_no: номер полки (0 - исходная БД)
+    :return: значение code_seq.max_value: счетчик не может превысить его
+    """
+    return (shelf_no + 1) * CODE_SPAN
+
+
+def is_valid_code(code: str) -> bool:
+    """
+    Проверяет код книги, введенный пользователем
+
+    :param code: код книги в виде строки
+    :return: True для старого 5-значного кода или кода с верной контрольной цифрой
+    """
+    if not code.isdigit() or code.startswith('0'):
+        return False
+    if len(code) == LEGACY_CODE_LENGTH:
+        return True
+    return len(code) > LEGACY_CODE_LENGTH and _damm(code) == 0
+
+
+class CodeAllocator:
+    """Выдает коды книг из блоков номеров, зарезервированных текущим процессом (по блоку на полку)"""
+
+    def __init__(self, block_size: int = 100) -> None:
+        self.block_size = block_size
+        self.__pid = None
+        # {полка: [следующий номер, конец блока]}
+        self.__blocks: dict[str | None, list[int]] = {}
+
+    def allocate(self, db: sqlite3.Connection, shelf: str | None = None) -> int:
+        """
+        Возвращает новый код книги
+
+        :param db: соединение с БД полки на чтение и запись (нужно только для резервирования блока),
+        shelf: имя полки (None, если полка одна)
+        :return: код книги
+        """
+        # после fork воркер не должен выдавать номера из блоков родительского процесса
+        if self.__pid != os.getpid():
+            self.__blocks = {}
+            self.__pid = os.getpid()
+        block = self.__blocks.get(shelf)
+        if block is None or block[0] >= block[1]:
+            block = self.__blocks[shelf] = self.__reserve(db)
+        number = block[0]
+        block[0] += 1
+        return make_code(number)
+
+    def __reserve(self, db: sqlite3.Connection) -> list[int]:
+        cur = db.cursor()
+        try:
+            # UPDATE и SELECT в одной транзакции: блок [stop - block_size, stop) достается только этому процессу
+            queries.execute(cur, 'reserve_codes', {'size': self.block_size})
+            seq = queries.fetchone(cur, 'code_seq')
+            stop = seq['next_value']
+            # номера за границей принадлежат следующей полке: отказ, счетчик откатывается
+            if stop > seq['max_value']:
+                raise sqlite3.DatabaseError('исчерпан диапазон кодов книг полки')
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        return [stop - self.block_size, stop]
+
@@ -1,71 +1,53 @@
+import fcntl
 import os
 import sqlite3
+import time
+from functools import partial
+from urllib.request import pathname2url
 
-from flask import (flash, g, redirect, render_template, request,
+from flask import (current_app, flash, g, redirect, render_template, request,
                    session, url_for, abort)
-from flask_mail import Mail, Message, email_dispatched
+from jinja2 import FileSystemBytecodeCache
 
 from apiflask import APIFlask
-from FDataBase import FDataBase
+from FDataBase import FDataBase, LRUCache
+from records import record_factory
+import queries
+from profiling import init_profiling
+from schema import ensure_schema
+from codes import CodeAllocator, is_valid_code
+from assets import init_assets
+from ratelimit import RateLimiter
+from shelves import get_catalog
 import conf.config as config
 import random
-from smtplib import SMTPException
+import hmac
+import hashlib
 import logging
 from logging.handlers import SMTPHandler, RotatingFileHandler
 
-application = APIFlask(__name__)
 
 #сигнал email_dispatched - Логирование события отправки письма. 
 #Он отправляется всякий раз, когда отправляется электронное письмо
 def log_message(message, app):
     app.logger.debug(message.subject)
 
-email_dispatched.connect(log_message)
-
-# конфигурация
-application.debug = config.DEBUG
-application.config['ADMINS'] = config.ADMINS
-application.config['SECRET_KEY'] = config.SECRET_KEY
-application.config['MAIL_SERVER'] = config.MAIL_SERVER
-application.config['MAIL_PORT'] = config.MAIL_PORT
-application.config['MAIL_USE_TLS'] = config.MAIL_USE_TLS
-application.config['MAIL_USE_SSL'] = config.MAIL_USE_SSL
-# введите свой адрес электронной почты здесь
-application.config['MAIL_USERNAME'] = config.MAIL_USERNAME
-# и здесь
-application.config['MAIL_DEFAULT_SENDER'] = config.MAIL_DEFAULT_SENDER
-application.config['MAIL_PASSWORD'] = config.MAIL_PASSWORD  # введите пароль
-
-mail = Mail(application)
-
-# if not application.debug:
-#     if application.config['MAIL_SERVER']:
-#         auth = None
-#         if application.config['MAIL_USERNAME'] or application.config['MAIL_PASSWORD']:
-#             auth = (application.config['MAIL_USERNAME'], application.config['MAIL_PASSWORD'])
-#         secure = None
-#         if application.config['MAIL_USE_TLS'] or application.config['MAIL_USE_SSL']:
-#             secure = ()
-#         mail_handler = SMTPHandler(
-#             mailhost=(application.config['MAIL_SERVER'], application.config['MAIL_PORT']),
-#             fromaddr=application.config['MAIL_DEFAULT_SENDER'],
-#             toaddrs=application.config['ADMINS'], subject='Ошибка в сервисе "Книжный перекресток"',
-#             credentials=auth, secure=secure)
-#         mail_handler.setLevel(logging.ERROR)
-#         application.logger.addHandler(mail_handler)
-
-if not application.debug:    
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/ssc_books.log', maxBytes=10240,
-                                       backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    file_handler.setLevel(logging.INFO)
-    application.logger.addHandler(file_handler)
-
-    application.logger.setLevel(logging.INFO)
-    application.logger.info('SSC_Books startup')
+
+def get_mail():
+    """
+    Подключает Flask-Mail при первой отправке письма (воркеру, который не отправляет писем,
+    не нужно импортировать smtplib и email при запуске)
+
+    Returns:
+    mail: состояние расширения Flask-Mail текущего приложения
+    """
+    if 'mail' not in current_app.extensions:
+        from flask_mail import Mail, email_dispatched
+
+        Mail(current_app._get_current_object())
+        email_dispatched.connect(log_message)
+    return current_app.extensions['mail']
+
 
 def sendMail(subject: str, body: str, users: list[str]) -> tuple[bool, str | None]:
     """
@@ -74,105 +56,504 @@ def sendMail(subject: str, body: str, users: list[str]) -> tuple[bool, str | Non
         :param: subject: заголовок письма, body: текст письма, users: список адресов эл. почты
         :return: кортеж с информацией о статусе отправки письма (true/false и описание ошибки(при наличии))
         """
+    from flask_mail import Message
+    from smtplib import SMTPException
+
     try:
-        with mail.connect() as conn:
+        with get_mail().connect() as conn:
             for user in users:
                 msg = Message(recipients=[user],
                               body=body,
                               subject=subject)
 
                 conn.send(msg)
-            application.logger.info(f'Письмо с темой "{subject}" отправлено пользователю {user}')
+            current_app.logger.info(f'Письмо с темой "{subject}" отправлено пользователю {user}')
             return (True, )
     except SMTPException as err:
         return (False, str(err))
 
 
-def connect_db():
+def get_shelf() -> str | None:
+    """Полка, выбранная пользователем (или первая из SHELVES)
+
+    Returns:
+        shelf: имя полки или None, если полки не настроены и БД одна (DB_PATH)
+    """
+    shelves = current_app.config['SHELVES']
+    if not shelves:
+        return None
+    shelf = session.get('shelf')
+    return shelf if shelf in shelves else next(iter(shelves))
+
+
+def shelf_path(shelf: str | None) -> str:
+    """Путь к файлу БД полки
+
+    Args:
+        shelf: имя полки или None
+
+    Returns:
+        db_path: путь к файлу БД
+    """
+    return current_app.config['SHELVES'][shelf] if shelf else current_app.config['DB_PATH']
+
+
+def connect_db(db_path: str):
     """
     Функция для подключения к базе данных.
 
+    Args:
+    db_path: путь к файлу БД полки
+
     Returns:
     conn: объект подключения к базе данных
     """
-    db_path = os.path.join(
-        'data/', 'ssc-books.db')
     conn = sqlite3.connect(db_path)
-    # Настраиваем, чтобы SQLite3 возвращал объект sqlite3.Row вместо обычного списка или кортежа,
-    # потому что он предоставляет удобный способ доступа к данным в строке результата запроса.
-    # Объект sqlite3.Row является объектом-контейнером,
-    # который позволяет обращаться к элементам строки результата запроса с помощью их имен или индексов.
-    conn.row_factory = sqlite3.Row
-    application.logger.info(f'Соединение с БД создано.')
+    # Режим WAL: читатели не блокируются писателем и наоборот
+    conn.execute('PRAGMA journal_mode = WAL')
+    ensure_schema(conn, db_path)
+    # Настраиваем, чтобы SQLite3 возвращал компактные строки-кортежи вместо обычного кортежа.
+    # Как и sqlite3.Row, они позволяют обращаться к элементам строки результата запроса
+    # с помощью их имен или индексов, но занимают меньше памяти и быстрее отрисовываются в шаблонах.
+    conn.row_factory = record_factory
+    current_app.logger.info(f'Соединение с БД создано.')
+    return conn
+
+
+def refresh_snapshot(db_path: str) -> str:
+    """
+    Обновляет снимок БД для чтения, если он старше DB_SNAPSHOT_TTL секунд.
+
+    Снимок собирается во временный файл и атомарно подменяет предыдущий,
+    поэтому воркеры, читающие старый снимок, дочитывают его без ошибок.
+    Собирает снимок один воркер (под блокировкой файла .lock), остальные
+    в это время читают прежний снимок, а не делают каждый свою копию БД.
+
+    Args:
+    db_path: путь к файлу БД полки
+
+    Returns:
+    snap_path: путь к файлу снимка БД
+    """
+    snap_path = f'{os.path.splitext(db_path)[0]}.snapshot.db'
+    ttl = current_app.config['DB_SNAPSHOT_TTL']
+
+    def is_stale() -> bool:
+        try:
+            return time.time() - os.path.getmtime(snap_path) > ttl
+        except OSError:
+            return True
+
+    if not is_stale():
+        return snap_path
+    has_snapshot = os.path.exists(snap_path)
+    with open(f'{snap_path}.lock', 'w') as lock:
+        try:
+            # без снимка читать нечего - ждем, пока его соберет другой воркер
+            fcntl.flock(lock, fcntl.LOCK_EX if not has_snapshot else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # снимок уже собирает другой воркер, пока читаем прежний
+            return snap_path
+        # пока ждали блокировку, снимок мог обновить другой воркер
+        if is_stale():
+            tmp_path = f'{snap_path}.tmp'
+            src = sqlite3.connect(db_path)
+            dst = sqlite3.connect(tmp_path)
+            try:
+                src.backup(dst)
+                # снимок в режиме rollback-журнала, чтобы его можно было открыть без -wal/-shm файлов
+                dst.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                dst.close()
+                src.close()
+            os.replace(tmp_path, snap_path)
+            current_app.logger.info(f'Снимок БД для чтения обновлен.')
+    return snap_path
+
+
+def open_db_ro(db_path: str, mmap_size: int):
+    """
+    Открывает соединение с файлом БД только на чтение (без контекста приложения,
+    поэтому годится и для потоков пула, см. catalog).
+
+    Соединение открывается по URI с mode=ro и query_only, поэтому не берет блокировок на запись.
+
+    Args:
+    db_path: путь к файлу БД или его снимка, mmap_size: размер mmap в байтах
+
+    Returns:
+    conn: объект подключения к базе данных только на чтение
+    """
+    conn = sqlite3.connect(f'file:{pathname2url(os.path.abspath(db_path))}?mode=ro', uri=True)
+    conn.execute('PRAGMA query_only = 1')
+    conn.execute(f'PRAGMA mmap_size = {int(mmap_size)}')
+    conn.row_factory = record_factory
+    return conn
+
+
+def read_path(db_path: str) -> str:
+    """
+    Путь к файлу, из которого читает соединение только на чтение:
+    если задан DB_SNAPSHOT_TTL - периодически обновляемый снимок БД, иначе сама БД.
+
+    Args:
+    db_path: путь к файлу БД полки
+
+    Returns:
+    path: путь к файлу БД или его снимка
+    """
+    return refresh_snapshot(db_path) if current_app.config['DB_SNAPSHOT_TTL'] else db_path
+
+
+def connect_db_ro(db_path: str):
+    """
+    Функция для подключения к базе данных только на чтение.
+
+    Если задан DB_SNAPSHOT_TTL, чтение идет из периодически обновляемого снимка БД.
+
+    Args:
+    db_path: путь к файлу БД полки
+
+    Returns:
+    conn: объект подключения к базе данных только на чтение
+    """
+    conn = open_db_ro(read_path(db_path), current_app.config['DB_MMAP_SIZE'])
+    current_app.logger.info(f'Соединение с БД только на чтение создано.')
     return conn
 
 
-def get_db():
-    """Соединение с БД, если оно еще не установлено
+def get_db(shelf: str | None = None):
+    """Соединение с БД полки, если оно еще не установлено
+
+    Args:
+        shelf: имя полки (по умолчанию - выбранная пользователем)
 
     Returns:
-        g.link_db: _Соединение с БД_
+        g.link_db[shelf]: _Соединение с БД полки_
     """
+    shelf = shelf or get_shelf()
     if not hasattr(g, 'link_db'):
-        g.link_db = connect_db()
-    return g.link_db
+        g.link_db = {}
+    if shelf not in g.link_db:
+        g.link_db[shelf] = connect_db(shelf_path(shelf))
+    return g.link_db[shelf]
 
-# хэндлер на событие - уничтожение контекста запроса
+
+def get_db_ro(shelf: str | None = None):
+    """Соединение с БД полки только на чтение, если оно еще не установлено
+
+    Args:
+        shelf: имя полки (по умолчанию - выбранная пользователем)
+
+    Returns:
+        g.link_db_ro[shelf]: _Соединение с БД полки только на чтение_
+    """
+    shelf = shelf or get_shelf()
+    if not hasattr(g, 'link_db_ro'):
+        g.link_db_ro = {}
+    if shelf not in g.link_db_ro:
+        g.link_db_ro[shelf] = connect_db_ro(shelf_path(shelf))
+    return g.link_db_ro[shelf]
+
+
+def get_user(dbase: FDataBase) -> tuple[int, int]:
+    """Пользователь сессии в БД текущей полки
+
+    На полке, где пользователя еще нет (например, полка только что добавлена в SHELVES), он регистрируется.
+    Если пользователь не найден или отключен, вход сбрасывается и запрос перенаправляется на страницу входа.
+
+    Args:
+        dbase: объект FDataBase текущей полки
+
+    Returns:
+        user: кортеж (id пользователя, принадлежность к администратору(0 | 1))
+    """
+    email = session['userLogged']
+    user = dbase.getUser(email)
+    if not user and current_app.config['SHELVES']:
+        dbase.registerUser(email)
+        user = dbase.getUser(email)
+    if not user:
+        session.pop('logged_in', None)
+        flash(f"Пользователь {email} не найден или отключен. Войдите, пожалуйста, заново. "
+              f"Если не удается устранить ошибку самостоятельно, \n"
+              f"обратитесь, пожалуйста, к организаторам проекта Книжный перекресток.", category='error')
+        abort(redirect(url_for('login')))
+    return user
+
+
+def is_admin() -> bool:
+    """Проверяет, что текущий пользователь сайта - администратор
+
+    Returns:
+        bool: True, если пользователь авторизован и является администратором
+    """
+    if 'logged_in' not in session:
+        return False
+    user = FDataBase(get_db(), get_db_ro(), get_shelf()).getUser(session['userLogged'])
+    return bool(user) and user[1] == 1
+
+
+
+def create_app() -> APIFlask:
+    """
+    Создает и настраивает приложение.
+
+    Тяжелая инициализация (почта) откладывается до первого использования, а шаблоны
+    компилируются здесь же: uWSGI загружает приложение в master-процессе до fork,
+    поэтому воркеры, в том числе перезапущенные после harakiri, получают готовые шаблоны.
+    Маршруты регистрируются здесь же, а вспомогательные функции работают через current_app,
+    кэш книг и выдача кодов хранятся в app.extensions, поэтому можно создать несколько приложений
+    с разной конфигурацией (например, для тестов). Общими для приложений процесса остаются логгер,
+    статистика SQL-запросов (queries.stats) и список БД с проверенной схемой (schema.py).
+
+    Returns:
+    app: объект приложения
+    """
+    app = APIFlask(__name__)
+
+    # конфигурация
+    app.debug = config.DEBUG
+    app.config['ADMINS'] = config.ADMINS
+    app.config['SECRET_KEY'] = config.SECRET_KEY
+    app.config['MAIL_SERVER'] = config.MAIL_SERVER
+    app.config['MAIL_PORT'] = config.MAIL_PORT
+    app.config['MAIL_USE_TLS'] = config.MAIL_USE_TLS
+    app.config['MAIL_USE_SSL'] = config.MAIL_USE_SSL
+    # введите свой адрес электронной почты здесь
+    app.config['MAIL_USERNAME'] = config.MAIL_USERNAME
+    # и здесь
+    app.config['MAIL_DEFAULT_SENDER'] = config.MAIL_DEFAULT_SENDER
+    app.config['MAIL_PASSWORD'] = config.MAIL_PASSWORD  # введите пароль
+    # БД: путь к файлу, период обновления снимка для чтения (0 - читать из основного файла), размер mmap для чтения.
+    # Со снимком страницы показывают данные с задержкой до DB_SNAPSHOT_TTL секунд: например, после выдачи книги
+    # личный кабинет может еще не показать её, пока снимок не обновится
+    app.config['DB_PATH'] = getattr(config, 'DB_PATH', os.path.join('data/', 'ssc-books.db'))
+    # полки в офисах: {имя полки: путь к файлу БД}, пусто - одна полка в DB_PATH. Файл БД новой полки
+    # создается командой "python shelves.py create <БД полки> <новая БД> <номер полки>" (см. shelves.py)
+    app.config['SHELVES'] = getattr(config, 'SHELVES', {})
+    app.config['DB_SNAPSHOT_TTL'] = getattr(config, 'DB_SNAPSHOT_TTL', 0)
+    app.config['DB_MMAP_SIZE'] = getattr(config, 'DB_MMAP_SIZE', 256 * 1024 * 1024)
+    # дамп БД в data/sql_damp.sql после каждого запроса (отключается, например, для нагрузочных прогонов)
+    app.config['DB_DUMP'] = getattr(config, 'DB_DUMP', True)
+    # каталог и период сохранения статистики запросов
+    app.config['QUERY_STATS_DIR'] = getattr(config, 'QUERY_STATS_DIR', os.path.join('logs/', 'query_stats'))
+    app.config['QUERY_STATS_INTERVAL'] = getattr(config, 'QUERY_STATS_INTERVAL', 60)
+    # размер кэша записей книг (на воркер)
+    app.config['BOOK_CACHE_SIZE'] = getattr(config, 'BOOK_CACHE_SIZE', 1024)
+    # размер блока кодов книг, резервируемого воркером за одно обращение к БД
+    app.config['CODE_BLOCK_SIZE'] = getattr(config, 'CODE_BLOCK_SIZE', 100)
+    # профилирование запросов администратором по требованию (см. profiling.py)
+    app.config['PROFILING'] = getattr(config, 'PROFILING', True)
+    app.config['PROFILE_DIR'] = getattr(config, 'PROFILE_DIR', os.path.join('logs/', 'profiles'))
+    app.config['PROFILE_MAX_FILES'] = getattr(config, 'PROFILE_MAX_FILES', 50)
+    # статические файлы с отпечатком содержимого и сжатие HTML-ответов (см. assets.py)
+    app.config['GZIP_MIN_SIZE'] = getattr(config, 'GZIP_MIN_SIZE', 1024)
+    app.config['GZIP_LEVEL'] = getattr(config, 'GZIP_LEVEL', 6)
+    # общий для всех процессов кэш байт-кода шаблонов и прогрев шаблонов при запуске
+    app.config['JINJA_CACHE_DIR'] = getattr(config, 'JINJA_CACHE_DIR', os.path.join('cache/', 'jinja'))
+    app.config['TEMPLATE_WARMUP'] = getattr(config, 'TEMPLATE_WARMUP', True)
+    # лимиты запросов кода подтверждения: (кол-во запросов, за сколько секунд) с одного IP и на один адрес почты
+    app.config['RATELIMIT_BACKEND'] = getattr(config, 'RATELIMIT_BACKEND', 'auto')
+    app.config['RATELIMIT_DB'] = getattr(config, 'RATELIMIT_DB', os.path.join('data/', 'ratelimit.db'))
+    app.config['LOGIN_LIMIT_IP'] = getattr(config, 'LOGIN_LIMIT_IP', (10, 600))
+    app.config['LOGIN_LIMIT_EMAIL'] = getattr(config, 'LOGIN_LIMIT_EMAIL', (3, 600))
+    # срок действия кода подтверждения (сек.) и допустимое кол-во попыток его ввода
+    app.config['VERIFY_CODE_TTL'] = getattr(config, 'VERIFY_CODE_TTL', 600)
+    app.config['VERIFY_CODE_ATTEMPTS'] = getattr(config, 'VERIFY_CODE_ATTEMPTS', 5)
+    # кол-во обращений на странице обратной связи
+    app.config['FEEDBACK_PAGE_SIZE'] = getattr(config, 'FEEDBACK_PAGE_SIZE', 50)
+
+    # if not app.debug:
+    #     if app.config['MAIL_SERVER']:
+    #         auth = None
+    #         if app.config['MAIL_USERNAME'] or app.config['MAIL_PASSWORD']:
+    #             auth = (app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
+    #         secure = None
+    #         if app.config['MAIL_USE_TLS'] or app.config['MAIL_USE_SSL']:
+    #             secure = ()
+    #         mail_handler = SMTPHandler(
+    #             mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
+    #             fromaddr=app.config['MAIL_DEFAULT_SENDER'],
+    #             toaddrs=app.config['ADMINS'], subject='Ошибка в сервисе "Книжный перекресток"',
+    #             credentials=auth, secure=secure)
+    #         mail_handler.setLevel(logging.ERROR)
+    #         app.logger.addHandler(mail_handler)
+
+    # логгер приложения общий для всех приложений модуля (logging.getLogger(app.name)),
+    # поэтому файловый обработчик добавляется только первым созданным приложением
+    log_path = os.path.abspath(os.path.join('logs', 'ssc_books.log'))
+    if not app.debug:    
+        if not os.path.exists('logs'):
+            os.mkdir('logs')
+        if not any(getattr(handler, 'baseFilename', None) == log_path for handler in app.logger.handlers):
+            file_handler = RotatingFileHandler(log_path, maxBytes=10240,
+                                               backupCount=10)
+            file_handler.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+            file_handler.setLevel(logging.INFO)
+            app.logger.addHandler(file_handler)
+
+        app.logger.setLevel(logging.INFO)
+        app.logger.info('SSC_Books startup')
+
+    os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+    if app.config['TEMPLATE_WARMUP']:
+        warmup_templates(app)
+
+    init_profiling(app, is_admin)
+    init_assets(app)
+    app.extensions['ratelimit'] = RateLimiter(app.config['RATELIMIT_BACKEND'], app.config['RATELIMIT_DB'])
+    app.extensions['book_cache'] = LRUCache(app.config['BOOK_CACHE_SIZE'])
+    app.extensions['code_allocator'] = CodeAllocator(app.config['CODE_BLOCK_SIZE'])
+
+    # маршруты (имена endpoint - имена функций-обработчиков)
+    app.teardown_appcontext(close_db)
+    app.add_url_rule("/", view_func=index, methods=["POST", "GET"])
+    app.add_url_rule("/about", view_func=about)
+    app.add_url_rule('/shelf/<name>', view_func=select_shelf, methods=["GET"])
+    app.add_url_rule("/catalog", view_func=catalog, methods=["GET"])
+    app.add_url_rule("/add_book", view_func=add_book, methods=["POST", "GET"])
+    app.add_url_rule('/book/<int:book_id>', view_func=show_book, methods=["GET"])
+    app.add_url_rule('/take_book', view_func=take_book, methods=["POST"])
+    app.add_url_rule('/return_book/<int:book_code>', view_func=return_book_get, methods=["GET"])
+    app.add_url_rule('/subscribe_book/<int:book_id>', view_func=subscribe_book, methods=["GET"])
+    app.add_url_rule('/unsubscribe_book/<int:book_id>', view_func=unsubscribe_book, methods=["GET"])
+    app.add_url_rule("/rules", view_func=rules, methods=["POST", "GET"])
+    app.add_url_rule("/lk", view_func=lk, methods=["POST", "GET"])
+    app.add_url_rule("/login", view_func=login, methods=["POST", "GET"])
+    app.add_url_rule('/verify_code', view_func=verify_code, methods=["POST", "GET"])
+    app.add_url_rule("/contact", view_func=contact, methods=["POST", "GET"])
+    app.add_url_rule('/close_feedback/<int:fb_id>', view_func=close_feedback, methods=["GET"])
+    app.add_url_rule("/exit", view_func=exit, methods=["GET"])
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(403, forbidden)
+    return app
+
+
+def allow_login(email: str) -> bool:
+    """Проверяет лимиты запросов кода подтверждения с IP-адреса клиента и на адрес почты
+
+    Args:
+        email: адрес эл. почты из формы входа
+
+    Returns:
+        bool: True, если код можно отправить
+    """
+    limiter = current_app.extensions['ratelimit']
+    return (limiter.allow(f'login:ip:{request.remote_addr}', current_app.config['LOGIN_LIMIT_IP'])
+            and limiter.allow(f'login:email:{email}', current_app.config['LOGIN_LIMIT_EMAIL']))
+
+
+def hash_code(email: str, code: str) -> str:
+    """Хэш кода подтверждения для хранения в БД (с ключом приложения, чтобы короткий код нельзя было подобрать по хэшу)"""
+    return hmac.new(current_app.config['SECRET_KEY'].encode(), f'{email}:{code}'.encode(), hashlib.sha256).hexdigest()
+
+
+def warmup_templates(app: APIFlask) -> None:
+    """
+    Компилирует все шаблоны приложения заранее (и сохраняет их байт-код в JINJA_CACHE_DIR),
+    чтобы первый запрос к странице не ждал компиляции
+
+    Args:
+        app: объект приложения
+    """
+    start = time.perf_counter()
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    app.logger.info(f'Шаблоны скомпилированы ({len(names)} шт.) за {(time.perf_counter() - start) * 1000:.0f} мс')
 
 
-@application.teardown_appcontext
+# хэндлер на событие - уничтожение контекста запроса
 def close_db(error):
     """Закрываем соединение с БД, если оно было установлено
 
     Args:
         error: ошибка
     """
-    if hasattr(g, 'link_db'):
-        # создается дамп БД
-        with open("data/sql_damp.sql", "w") as f:
-            for sql in g.link_db.iterdump():
-                f.write(sql)
+    for shelf, conn in getattr(g, 'link_db', {}).items():
+        # создается дамп БД (для каждой полки - свой)
+        if current_app.config['DB_DUMP']:
+            with open("data/sql_damp.sql" if shelf is None else f"data/sql_damp.{shelf}.sql", "w") as f:
+                for sql in conn.iterdump():
+                    f.write(sql)
         # закрывается соединение с БД
-        g.link_db.close()
-        application.logger.info(f'Соединение с БД закрыто.')
+        conn.close()
+        current_app.logger.info(f'Соединение с БД закрыто.')
+    for conn in getattr(g, 'link_db_ro', {}).values():
+        conn.close()
+    # статистика запросов воркера для отчета "python queries.py"
+    queries.stats.dump(current_app.config['QUERY_STATS_DIR'], current_app.config['QUERY_STATS_INTERVAL'])
 
 
-@application.route("/", methods=["POST", "GET"])
 def index():
     if 'logged_in' in session:
         if request.method == "POST":
             pass
         else:
-            db = get_db()
-            dbase = FDataBase(db)
-            user_id = dbase.getUser(session['userLogged'])
+            dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
+            user_id = get_user(dbase)
             return render_template('index.html', title='Полка "Книжного перекрестка"',
                                    avl_books=dbase.getAvailableBooks(),
                                    # False, т.е. не для отображения в ЛК, а для Главной
                                    taken_books=dbase.getTakenBooks(
                                        user_id[0], False),
+                                   shelves=current_app.config['SHELVES'], shelf=get_shelf(),
                                    menu=dbase.getMenu(), user=session['userLogged'].split('@')[0])
     else:
         return redirect(url_for('login'))
 
 
-@application.route("/about")
 def about():
     if 'logged_in' in session:
-        db = get_db()
-        dbase = FDataBase(db)
+        dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
         return render_template('about.html', title='О проекте "Книжный перекресток"', menu=dbase.getMenu(),
                                user=session['userLogged'].split('@')[0])
     else:
         return redirect(url_for('login'))
 
 
-@application.route("/add_book", methods=["POST", "GET"])
+def select_shelf(name):
+    if 'logged_in' in session:
+        if name not in current_app.config['SHELVES']:
+            abort(404)
+        # у каждой полки своя БД: при первом выборе полки пользователь регистрируется в ней
+        dbase = FDataBase(get_db(name), get_db_ro(name), name)
+        res = dbase.registerUser(session['userLogged'])
+        if not res[0]:
+            flash(f"Ошибка при выборе полки {name}: {res[1]}. Если не удается устранить ошибку самостоятельно, \n"
+                  f"сообщите, пожалуйста, нам об ошибке через форму обратной связи.", category='error')
+            return redirect(url_for('index'))
+        session['shelf'] = name
+        flash(f'Выбрана полка "{name}". Книги берутся и возвращаются на этой полке.', category='success')
+        return redirect(url_for('index'))
+    else:
+        return redirect(url_for('login'))
+
+
+def catalog():
+    if 'logged_in' in session:
+        if not current_app.config['SHELVES']:
+            return redirect(url_for('index'))
+        dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
+        # конфигурация и снимки БД - здесь, в потоке запроса: потоки пула только открывают
+        # соединения и выполняют запросы, контекст приложения (и его teardown) им не нужен
+        shelves = {name: read_path(db_path) for name, db_path in current_app.config['SHELVES'].items()}
+        connect = partial(open_db_ro, mmap_size=current_app.config['DB_MMAP_SIZE'])
+        return render_template('catalog.html', title='Свободные книги на всех полках',
+                               catalog=get_catalog(shelves, connect),
+                               shelf=get_shelf(), menu=dbase.getMenu(),
+                               user=session['userLogged'].split('@')[0])
+    else:
+        return redirect(url_for('login'))
+
+
 def add_book():
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if 'logged_in' in session:
-        user_id = dbase.getUser(session['userLogged'])
+        user_id = get_user(dbase)
         if request.method == "POST":
             # title, author, year, status, add_userid
             res = dbase.addBook(request.form["title-book"].strip(),
@@ -195,14 +576,27 @@ def add_book():
         return redirect(url_for('login'))
 
 
-@application.route('/take_book', methods=["POST"])
+def show_book(book_id):
+    if 'logged_in' in session:
+        dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
+        book = dbase.getBook(book_id)
+        if not book:
+            abort(404)
+        return render_template('book.html', title=f'Книга #{book[0]}', book=book,
+                               holder=dbase.getBookHolder(book_id),
+                               history=dbase.getBookHistory(book_id),
+                               subscribers=dbase.getBookSubscribersCount(book_id),
+                               menu=dbase.getMenu(), user=session['userLogged'].split('@')[0])
+    else:
+        return redirect(url_for('login'))
+
+
 def take_book():
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if 'logged_in' in session:
-        user_id = dbase.getUser(session['userLogged'])
+        user_id = get_user(dbase)
         book_code = request.form['book_code'].strip()
-        if book_code.isdigit() and len(book_code) == 5:
+        if is_valid_code(book_code):
             res = dbase.takeBook(book_code, user_id[0])
             if not res[0]:
                 flash(f"Ошибка при выдаче книги из каталога: {res[1]}. Если не удается устранить ошибку самостоятельно, \n"
@@ -211,19 +605,18 @@ def take_book():
                 flash((f"Книга под номером #{request.form['book_code'].strip()} успешно выдана из каталога (заведено новых формуляров: {res[1]}). "
                        f'Возьмите, пожалуйста, книгу с полки в зоне обмена "Книжного перекрестка".'), category='success')
         else:
-            flash(f"Ошибка при указании кода книги: код должен состоять из 5 цифр. Если не удается устранить ошибку самостоятельно, \n"
+            flash(f"Ошибка при указании кода книги: код должен состоять из 5 цифр или из 6 и более цифр с контрольной цифрой на конце. "
+                  f"Если не удается устранить ошибку самостоятельно, \n"
                   f"сообщите, пожалуйста, нам об ошибке через форму обратной связи.", category='error')
         return redirect(url_for('lk'))
     else:
         return redirect(url_for('login'))
 
 
-@application.route('/return_book/<int:book_code>', methods=["GET"])
 def return_book_get(book_code):
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if 'logged_in' in session:
-        user_id = dbase.getUser(session['userLogged'])
+        user_id = get_user(dbase)
         res = dbase.returnBook(book_code, user_id[0])
         if not res[0]:
             flash(f"Ошибка при возврате книги в каталог: {res[1]}. Если не удается устранить ошибку самостоятельно, \n"
@@ -237,12 +630,10 @@ def return_book_get(book_code):
         return redirect(url_for('login'))
 
 
-@application.route('/subscribe_book/<int:book_id>', methods=["GET"])
 def subscribe_book(book_id):
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if 'logged_in' in session:
-        user_id = dbase.getUser(session['userLogged'])
+        user_id = get_user(dbase)
         res = dbase.subscribeBook(book_id, user_id[0])
         book = dbase.getBook(book_id)
         if not res[0] or not book:
@@ -265,12 +656,10 @@ def subscribe_book(book_id):
         return redirect(url_for('login'))
 
 
-@application.route('/unsubscribe_book/<int:book_id>', methods=["GET"])
 def unsubscribe_book(book_id):
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if 'logged_in' in session:
-        user_id = dbase.getUser(session['userLogged'])
+        user_id = get_user(dbase)
         res = dbase.unsubscribeBook(book_id, user_id[0])
         if not res[0]:
             flash(f"Ошибка при отписке от книги: {res[1]}. Если не удается устранить ошибку самостоятельно, \n"
@@ -284,11 +673,9 @@ def unsubscribe_book(book_id):
         return redirect(url_for('login'))
 
 
-@application.route("/rules", methods=["POST", "GET"])
 def rules():
     if 'logged_in' in session:
-        db = get_db()
-        dbase = FDataBase(db)
+        dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
         return render_template('rules.html', title='Правила проекта "Книжный перекрёсток"',
                                rules=dbase.getRules(),
                                menu=dbase.getMenu(),
@@ -297,12 +684,10 @@ def rules():
         return redirect(url_for('login'))
 
 
-@application.route("/lk", methods=["POST", "GET"])
 def lk():
     if 'logged_in' in session:
-        db = get_db()
-        dbase = FDataBase(db)
-        user_id = dbase.getUser(session['userLogged'])
+        dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
+        user_id = get_user(dbase)
         return render_template('lk.html', title='Личный кабинет',
                                # True - т.е. для отображения в ЛК, а не на главной
                                taken_books=dbase.getTakenBooks(
@@ -319,19 +704,27 @@ def lk():
 # и перенаправляй на спец страницу с формой для ввода полученного кода
 
 
-@application.route("/login", methods=["POST", "GET"])
 def login():
     if 'logged_in' in session:
         return redirect(url_for('rules'))
 
-    db = get_db()
-    dbase = FDataBase(db)
+    # лимиты проверяются до обращения к БД и почтовому серверу
+    if request.method == 'POST' and not allow_login(request.form['email'].lower().strip()):
+        flash(f"Слишком много запросов кода подтверждения. Попробуйте, пожалуйста, через несколько минут.", category='error')
+        return redirect(url_for('login'))
+
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if request.method == 'POST':
         email = request.form['email'].lower().strip()
         if email.split('@')[1] == 'tele2.ru':
             session['userLogged'] = email
             code = random.randint(1000, 9999)  # генерация случайного кода
-            session['code'] = code  # сохранение кода в сессии
+            # сохранение кода на сервере (в сессии остается только адрес почты)
+            res = dbase.addVerifyCode(email, hash_code(email, str(code)), current_app.config['VERIFY_CODE_TTL'])
+            if not res[0]:
+                flash(f"Ошибка при сохранении кода подтверждения: {res[1]}. Если не удается устранить ошибку самостоятельно, \n"
+                      f"обратитесь, пожалуйста, к организаторам проекта Книжный перекресток.", category='error')
+                return redirect(url_for('login'))
             is_sent = sendMail('Код подтверждения',
                                f'Ваш код подтверждения: {code}',
                                [email])
@@ -353,16 +746,16 @@ def login():
 # обработка ввода кода подтверждения
 
 
-@application.route('/verify_code', methods=["POST", "GET"])
 def verify_code():
     if 'logged_in' in session:
         return redirect(url_for('rules'))
 
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if request.method == 'POST':
-        code = request.form['code']
-        if 'code' in session and str(session['code']) == code:
+        code = request.form['code'].strip()
+        if 'userLogged' in session and dbase.checkVerifyCode(session['userLogged'],
+                                                             hash_code(session['userLogged'], code),
+                                                             current_app.config['VERIFY_CODE_ATTEMPTS']):
             is_user = dbase.getUser(session['userLogged'])
             if not is_user:
                 res = dbase.addUser(session['userLogged'])
@@ -390,12 +783,10 @@ def verify_code():
         return render_template('verify_code.html', title="Ввод кода подтверждения", menu=dbase.getMenu())
 
 
-@application.route("/contact", methods=["POST", "GET"])
 def contact():
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if 'logged_in' in session:
-        user_id = dbase.getUser(session['userLogged'])
+        user_id = get_user(dbase)
         if request.method == "POST":
             msg = request.form['message'].strip()
             res = dbase.addFeedback(msg, user_id[0])
@@ -406,19 +797,29 @@ def contact():
                 flash((f"Обращение #{res[1]} принято в работу. "
                        f"Ожидайте ответа на адрес вашей эл. почты {session['userLogged']}"), category='success')
 
+        # администратор видит очередь всех обращений с фильтром по статусу, пользователь - только свои обращения
+        status = request.args.get('status', 'open')
+        before = request.args.get('before', 0, type=int)
+        page_size = current_app.config['FEEDBACK_PAGE_SIZE']
+        if user_id[1] == 1:
+            feedbacks = dbase.getFeedbacks(status=status, before=before, limit=page_size + 1)
+        else:
+            feedbacks = dbase.getFeedbacks(user_id=user_id[0], before=before, limit=page_size + 1)
+        # лишняя запись говорит о том, что есть следующая страница
+        next_before = feedbacks[page_size - 1]['id'] if len(feedbacks) > page_size else None
+
         return render_template('contact.html', title="Обратная связь", menu=dbase.getMenu(),
-                               feedbacks=dbase.getAllFeedbacks(), user=session['userLogged'].split('@')[0],
+                               feedbacks=feedbacks[:page_size], status=status, before=before,
+                               next_before=next_before, user=session['userLogged'].split('@')[0],
                                is_admin=user_id[1])
     else:
         return redirect(url_for('login'))
 
 
-@application.route('/close_feedback/<int:fb_id>', methods=["GET"])
 def close_feedback(fb_id):
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     if 'logged_in' in session:
-        user_id = dbase.getUser(session['userLogged'])
+        user_id = get_user(dbase)
         if user_id[1] != 1:
             return redirect(url_for('contact'))
 
@@ -435,26 +836,23 @@ def close_feedback(fb_id):
         return redirect(url_for('login'))
 
 
-@application.route("/exit", methods=["GET"])
 def exit():
     session.clear()
     return redirect(url_for('login'))
 
 
-@application.errorhandler(404)
 def page_not_found(error):
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     return render_template('page404.html', title='Страница не найдена', menu=dbase.getMenu()), 404
 
 
-@application.errorhandler(403)
 def forbidden(error):
-    db = get_db()
-    dbase = FDataBase(db)
+    dbase = FDataBase(get_db(), get_db_ro(), get_shelf())
     return render_template('page403.html', title='Доступ к информации ограничен, т.к. вы не являетесь администратором ресурса.',
                            menu=dbase.getMenu()), 403
 
 
+application = create_app()
+
 if __name__ == "__main__":
     application.run(host='0.0.0.0')
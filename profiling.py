@@ -0,0 +1,79 @@
+"""
+Профилирование отдельного запроса к сайту по требованию администратора.
+
+Профилирование включается заголовком "X-Profile: 1" или параметром "?_profile=1"
+и только для администратора. Для обычных запросов вся цена - проверка заголовка
+и параметра в before_request; при PROFILING = False обработчики не регистрируются вовсе.
+
+По каждому профилированному запросу в PROFILE_DIR сохраняются:
+    <время>-<endpoint>-<pid>.prof      - профиль cProfile (pstats), для флеймграфа:
+                                         flameprof file.prof > file.svg или snakeviz file.prof
+    <время>-<endpoint>-<pid>.sql.json  - SQL-запросы FDataBase (имя, время, кол-во строк)
+В каталоге хранится не более PROFILE_MAX_FILES профилей, старые удаляются.
+"""
+import cProfile
+import glob
+import json
+import os
+import time
+
+from typing import Callable
+
+from flask import Flask, g, request
+
+import queries
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ARG = '_profile'
+
+
+def _is_requested() -> bool:
+    return request.headers.get(PROFILE_HEADER) == '1' or request.args.get(PROFILE_ARG) == '1'
+
+
+def _cleanup(profile_dir: str, max_files: int) -> None:
+    """Удаляет самые старые профили сверх max_files"""
+    profiles = sorted(glob.glob(os.path.join(profile_dir, '*.prof')))
+    for path in profiles[:max(len(profiles) - max_files, 0)]:
+        for name in (path, f'{path[:-len(".prof")]}.sql.json'):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+
+def init_profiling(app: Flask, is_admin: Callable[[], bool]) -> None:
+    """
+    Регистрирует обработчики профилирования запросов
+
+    :param app: приложение, is_admin: функция, проверяющая, что текущий пользователь - администратор
+    """
+    if not app.config.get('PROFILING', True):
+        return
+    profile_dir = app.config.get('PROFILE_DIR', os.path.join('logs/', 'profiles'))
+    max_files = app.config.get('PROFILE_MAX_FILES', 50)
+
+    @app.before_request
+    def start_profiling():
+        if not _is_requested() or not is_admin():
+            return
+        queries.start_trace()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.teardown_request
+    def stop_profiling(error):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        sql = queries.stop_trace()
+        os.makedirs(profile_dir, exist_ok=True)
+        base = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{os.getpid()}")
+        profiler.dump_stats(f'{base}.prof')
+        with open(f'{base}.sql.json', 'w') as f:
+            json.dump({'path': request.full_path, 'method': request.method,
+                       'queries': [{'name': name, 'time': elapsed, 'rows': rows}
+                                   for name, elapsed, rows in sql]}, f, ensure_ascii=False, indent=1)
+        _cleanup(profile_dir, max_files)
+        app.logger.info(f'Профиль запроса {request.full_path} сохранен в {base}.prof')
@@ -0,0 +1,302 @@
+"""
+Реестр SQL-запросов приложения и статистика их выполнения.
+
+Все запросы FDataBase хранятся здесь под именами: текст запроса не меняется от вызова
+к вызову, поэтому время выполнения можно собрать и сравнить по каждому запросу.
+
+Отчет о самых медленных запросах с планами выполнения (EXPLAIN QUERY PLAN):
+    python queries.py [-n 10] [--db data/ssc-books.db] [--stats logs/query_stats]
+"""
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+
+from contextvars import ContextVar
+from typing import Any
+
+from schema import NOT_DELETED
+
+# очередь обращений: постраничная выборка по ключу (id < :before) от новых к старым.
+# Статус определяется равенством dt_delete = NOT_DELETED (как в частичном индексе idx_feedbacks_open)
+_FEEDBACKS = """
+        SELECT f.id, u.email, f.msg,
+            strftime('%d.%m.%Y %H:%M', f.dt_new) AS dt_open,
+            strftime('%d.%m.%Y %H:%M', f.dt_delete) AS dt_close,
+            CASE WHEN f.dt_delete = '{not_deleted}' THEN 0 ELSE 1 END AS is_closed
+        FROM feedbacks AS f JOIN users AS u ON f.user_id = u.id
+        WHERE f.id < :before {where}
+        ORDER BY f.id DESC
+        LIMIT :limit"""
+
+QUERIES: dict[str, str] = {
+    'book_id': "SELECT id FROM books WHERE code = ? AND is_on = 1",
+    'menu': "SELECT * FROM mainmenu",
+    'add_user': "INSERT INTO users(email) VALUES(?)",
+    # регистрация на полке: отключенный на полке пользователь не добавляется заново
+    'register_user': "INSERT INTO users(email) SELECT :email WHERE NOT EXISTS (SELECT 1 FROM users WHERE email = :email)",
+    'user': "SELECT id, is_admin FROM users WHERE email = ? AND is_on = 1",
+    'add_book': "INSERT INTO books(code, title, author, genre_id, public_year, owner_id) VALUES(?, ?, ?, ?, ?, ?)",
+    'reserve_codes': "UPDATE code_seq SET next_value = next_value + :size WHERE id = 1",
+    'code_seq': "SELECT next_value, max_value FROM code_seq WHERE id = 1",
+    # новый формуляр, только если книга активна, не выдана никому и у читателя нет другой невозвращенной книги
+    'take_book': """
+        INSERT INTO forms (user_id, book_id, dt_take)
+        SELECT :user_id, :book_id, datetime('now', 'localtime')
+        WHERE NOT EXISTS (
+            SELECT 1 FROM forms
+            WHERE (book_id = :book_id AND dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime'))
+            OR (user_id = :user_id AND dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime'))
+        ) AND EXISTS (
+            SELECT 1 FROM books
+            WHERE id = :book_id AND is_on = 1
+        )""",
+    # возврат закрывает открытый формуляр читателя (уже действующий: dt_take и dt_new не в будущем)
+    'return_book': """
+        UPDATE forms
+        SET dt_return = datetime('now', 'localtime')
+        WHERE user_id = :user_id
+        AND book_id = :book_id
+        AND dt_return > datetime('now', 'localtime')
+        AND dt_take <= datetime('now', 'localtime')
+        AND dt_new <= datetime('now', 'localtime')
+        AND dt_delete > datetime('now', 'localtime')""",
+    # новая подписка, только если у читателя нет открытой подписки на книгу,
+    # книга выдана, но не ему самому, и книга активна
+    'subscribe_book': """
+        INSERT INTO subscriptions (user_id, book_id)
+        SELECT :user_id, :book_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM subscriptions
+            WHERE book_id = :book_id AND user_id = :user_id
+            AND dt_new <= datetime('now', 'localtime') AND dt_delete > datetime('now', 'localtime')
+        ) AND EXISTS (
+            SELECT 1 FROM forms
+            WHERE book_id = :book_id AND dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime')
+            AND user_id != :user_id
+        ) AND EXISTS (
+            SELECT 1 FROM books
+            WHERE id = :book_id AND is_on = 1
+        )""",
+    'unsubscribe_book': """
+        UPDATE subscriptions
+        SET dt_delete = datetime('now', 'localtime')
+        WHERE user_id = :user_id
+        AND book_id = :book_id
+        AND dt_new <= datetime('now', 'localtime')
+        AND dt_delete > datetime('now', 'localtime')""",
+    'subscriptions': "SELECT * FROM vw_open_subs_wide",
+    'user_subscriptions': "SELECT * FROM vw_open_subs_wide WHERE user_id = ?",
+    'rules': "SELECT * FROM rules WHERE is_on = 1",
+    'book': """
+        SELECT t1.code, t1.title, t1.author, g.genre, t1.public_year, u.email AS owner
+        FROM books AS t1 JOIN genres AS g ON t1.genre_id = g.id
+        LEFT JOIN users AS u ON t1.owner_id = u.id
+        WHERE t1.id = ?""",
+    'book_holder': "SELECT * FROM vw_taken_books WHERE book_id = ?",
+    'book_history': "SELECT * FROM vw_book_log WHERE book_id = ?",
+    'book_subscribers': "SELECT COUNT(*) AS cnt FROM vw_open_subs_wide WHERE book_id = ?",
+    # id книги нужен для ссылки на страницу книги (код книги уникален, см. schema.py)
+    'available_books': """
+        SELECT ab.*, b.id AS book_id
+        FROM vw_available_books AS ab JOIN books AS b ON b.code = ab.code""",
+    'user_taken_books': "SELECT * FROM vw_taken_books WHERE user_id = ?",
+    # выданные книги с признаком подписки текущего пользователя на каждую из них
+    'taken_books': """
+        SELECT tb.*,
+            CASE WHEN s.subs_book_id IS NULL THEN 0
+            ELSE 1
+            END AS subs_status
+        FROM vw_taken_books AS tb
+        LEFT JOIN vw_open_subs_trim AS s ON tb.book_id = s.subs_book_id
+        AND s.subs_user_id = :user_id""",
+    'book_log': "SELECT * FROM vw_book_log",
+    'user_book_log': "SELECT * FROM vw_book_log WHERE user_id = ?",
+    'genres': "SELECT id, genre FROM genres WHERE is_on = 1",
+    'add_feedback': "INSERT INTO feedbacks(msg, user_id) VALUES(?, ?)",
+    'close_feedback': """
+        UPDATE feedbacks
+        SET dt_delete = datetime('now', 'localtime')
+        WHERE id = :fb_id
+        AND dt_new <= datetime('now', 'localtime')
+        AND dt_delete > datetime('now', 'localtime')""",
+    'feedbacks_open': _FEEDBACKS.format(not_deleted=NOT_DELETED, where=f"AND f.dt_delete = '{NOT_DELETED}'"),
+    'feedbacks_closed': _FEEDBACKS.format(not_deleted=NOT_DELETED, where=f"AND f.dt_delete <> '{NOT_DELETED}'"),
+    'feedbacks_all': _FEEDBACKS.format(not_deleted=NOT_DELETED, where=""),
+    'user_feedbacks': _FEEDBACKS.format(not_deleted=NOT_DELETED, where="AND f.user_id = :user_id"),
+    'purge_verify_codes': "DELETE FROM verify_codes WHERE dt_expire <= datetime('now', 'localtime')",
+    'add_verify_code': """
+        INSERT OR REPLACE INTO verify_codes (email, code_hash, dt_expire, attempts)
+        VALUES (:email, :code_hash, datetime('now', 'localtime', :ttl), 0)""",
+    # код погашается, только если он верный, не истек и попытки ввода не исчерпаны
+    'use_verify_code': """
+        DELETE FROM verify_codes
+        WHERE email = :email AND code_hash = :code_hash
+        AND dt_expire > datetime('now', 'localtime')
+        AND attempts < :max_attempts""",
+    'fail_verify_code': "UPDATE verify_codes SET attempts = attempts + 1 WHERE email = ?",
+}
+
+
+class QueryStats:
+    """Счетчики по запросам реестра: кол-во вызовов, суммарное время (сек.) и кол-во строк"""
+
+    def __init__(self) -> None:
+        self.calls: dict[str, int] = {}
+        self.time: dict[str, float] = {}
+        self.rows: dict[str, int] = {}
+        self.__dumped: float | None = None
+
+    def record(self, name: str, elapsed: float, rows: int) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.time[name] = self.time.get(name, 0.0) + elapsed
+        self.rows[name] = self.rows.get(name, 0) + max(rows, 0)
+
+    def as_dict(self) -> dict[str, dict[str, int | float]]:
+        return {name: {'calls': self.calls[name], 'time': self.time[name], 'rows': self.rows[name]}
+                for name in self.calls}
+
+    def dump(self, stats_dir: str, interval: float = 0) -> None:
+        """
+        Сохраняет счетчики текущего процесса в stats_dir/<pid>.json
+
+        :param stats_dir: каталог со статистикой воркеров,
+        interval: не сохранять чаще, чем раз в interval секунд
+        """
+        now = time.monotonic()
+        if not self.calls or interval and self.__dumped is not None and now - self.__dumped < interval:
+            return
+        self.__dumped = now
+        os.makedirs(stats_dir, exist_ok=True)
+        path = os.path.join(stats_dir, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.as_dict(), f)
+        os.replace(f'{path}.tmp', path)
+
+
+stats = QueryStats()
+
+# журнал запросов текущего запроса к сайту (включается только при профилировании, см. profiling.py)
+_trace: ContextVar[list | None] = ContextVar('query_trace', default=None)
+
+
+def start_trace() -> None:
+    """Начинает запись запросов реестра, выполняемых в текущем контексте"""
+    _trace.set([])
+
+
+def stop_trace() -> list[tuple[str, float, int]]:
+    """
+    Завершает запись запросов реестра
+
+    :return: список (имя запроса, время выполнения в сек., кол-во строк)
+    """
+    trace = _trace.get() or []
+    _trace.set(None)
+    return trace
+
+
+def _record(name: str, elapsed: float, rows: int) -> None:
+    stats.record(name, elapsed, rows)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((name, elapsed, rows))
+
+
+def execute(cur: sqlite3.Cursor, name: str, params: tuple | dict = ()) -> sqlite3.Cursor:
+    """
+    Выполняет изменяющий запрос из реестра
+
+    :param cur: курсор, name: имя запроса в реестре, params: параметры запроса
+    :return: курсор (rowcount, lastrowid)
+    """
+    start = time.perf_counter()
+    cur.execute(QUERIES[name], params)
+    _record(name, time.perf_counter() - start, cur.rowcount)
+    return cur
+
+
+def fetchone(cur: sqlite3.Cursor, name: str, params: tuple | dict = ()) -> Any:
+    """
+    Выполняет запрос из реестра и возвращает первую строку результата
+
+    :param cur: курсор, name: имя запроса в реестре, params: параметры запроса
+    :return: строка результата или None
+    """
+    start = time.perf_counter()
+    cur.execute(QUERIES[name], params)
+    res = cur.fetchone()
+    _record(name, time.perf_counter() - start, 1 if res else 0)
+    return res
+
+
+def fetchall(cur: sqlite3.Cursor, name: str, params: tuple | dict = ()) -> list:
+    """
+    Выполняет запрос из реестра и возвращает все строки результата
+
+    :param cur: курсор, name: имя запроса в реестре, params: параметры запроса
+    :return: список строк результата
+    """
+    start = time.perf_counter()
+    cur.execute(QUERIES[name], params)
+    res = cur.fetchall()
+    _record(name, time.perf_counter() - start, len(res))
+    return res
+
+
+def load_stats(stats_dir: str) -> dict[str, dict[str, int | float]]:
+    """Суммирует статистику всех воркеров из stats_dir"""
+    total: dict[str, dict[str, int | float]] = {}
+    for path in glob.glob(os.path.join(stats_dir, '*.json')):
+        with open(path) as f:
+            for name, counters in json.load(f).items():
+                acc = total.setdefault(name, {'calls': 0, 'time': 0.0, 'rows': 0})
+                for key, value in counters.items():
+                    acc[key] += value
+    return total
+
+
+def explain(conn: sqlite3.Connection, name: str) -> list[str]:
+    """
+    Возвращает план выполнения запроса из реестра (параметры подставляются как NULL)
+
+    :param conn: соединение с БД, name: имя запроса в реестре
+    :return: строки плана выполнения
+    """
+    sql = QUERIES[name]
+    named = set(re.findall(r':(\w+)', sql))
+    params = dict.fromkeys(named) if named else (None,) * sql.count('?')
+    return [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def report(db_path: str, stats_dir: str, limit: int) -> None:
+    """Печатает самые медленные (по суммарному времени) запросы и их планы выполнения"""
+    total = load_stats(stats_dir)
+    if not total:
+        print(f'Нет статистики запросов в {stats_dir}')
+        return
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    slowest = sorted(total.items(), key=lambda item: item[1]['time'], reverse=True)[:limit]
+    for name, s in slowest:
+        print(f"{name}: вызовов {s['calls']}, всего {s['time'] * 1000:.1f} мс, "
+              f"в среднем {s['time'] * 1000 / s['calls']:.3f} мс, строк {s['rows']}")
+        try:
+            for line in explain(conn, name):
+                print(f'    {line}')
+        except (KeyError, sqlite3.Error) as err:
+            print(f'    план выполнения недоступен - {str(err)}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Отчет о самых медленных SQL-запросах')
+    parser.add_argument('-n', type=int, default=10, help='кол-во запросов в отчете')
+    parser.add_argument('--db', default=os.path.join('data/', 'ssc-books.db'), help='путь к БД')
+    parser.add_argument('--stats', default=os.path.join('logs/', 'query_stats'),
+                        help='каталог со статистикой воркеров')
+    args = parser.parse_args()
+    report(args.db, args.stats, args.n)
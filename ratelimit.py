@@ -0,0 +1,123 @@
+"""
+Ограничение частоты запросов (token bucket), общее для всех воркеров uWSGI.
+
+Каждому ключу (например, "ip:10.0.0.1" или "email:user@tele2.ru") соответствует корзина
+на capacity токенов, которая равномерно наполняется за period секунд. Запрос забирает
+один токен; если токенов нет, запрос отклоняется до обращения к БД и почтовому серверу.
+
+Состояние корзин хранится:
+    - в кэше uWSGI (cache2 = name=ratelimit,... в uwsgi.ini) - в общей памяти воркеров;
+    - иначе в отдельном файле SQLite (RATELIMIT_DB), например при запуске без uWSGI.
+"""
+import os
+import sqlite3
+import time
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: int, period: float) -> float:
+    return min(capacity, tokens + (now - updated) * capacity / period)
+
+
+class UwsgiBuckets:
+    """Корзины в кэше uWSGI, изменение защищено блокировкой uWSGI"""
+
+    def __init__(self, cache_name: str) -> None:
+        self.cache_name = cache_name
+
+    def take(self, key: str, capacity: int, period: float) -> bool:
+        now = time.time()
+        uwsgi.lock()
+        try:
+            value = uwsgi.cache_get(key, self.cache_name)
+            if value:
+                tokens, updated = map(float, value.split(b':'))
+                tokens = _refill(tokens, updated, now, capacity, period)
+            else:
+                tokens = capacity
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            uwsgi.cache_update(key, f'{tokens}:{now}'.encode(), int(period) + 1, self.cache_name)
+        finally:
+            uwsgi.unlock()
+        return allowed
+
+
+class SQLiteBuckets:
+    """Корзины в отдельном файле SQLite, изменение - в транзакции BEGIN IMMEDIATE"""
+
+    # раз в сколько вызовов удалять давно не использованные корзины
+    PURGE_EVERY = 1000
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.__conn = None
+        self.__pid = None
+        self.__calls = 0
+
+    def __connect(self) -> sqlite3.Connection:
+        # соединение открывается в воркере, а не наследуется от master-процесса
+        if self.__conn is None or self.__pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            self.__conn = sqlite3.connect(self.db_path, timeout=1, isolation_level=None)
+            self.__conn.execute('PRAGMA journal_mode = WAL')
+            # потеря состояния корзин при сбое не критична
+            self.__conn.execute('PRAGMA synchronous = OFF')
+            self.__conn.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)""")
+            self.__pid = os.getpid()
+        return self.__conn
+
+    def take(self, key: str, capacity: int, period: float) -> bool:
+        conn = self.__connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = _refill(row[0], row[1], now, capacity, period) if row else capacity
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            self.__calls += 1
+            if self.__calls % self.PURGE_EVERY == 0:
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - 86400,))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed
+
+
+class RateLimiter:
+    """Проверка лимитов по ключам"""
+
+    def __init__(self, backend: str = 'auto', db_path: str = 'data/ratelimit.db',
+                 cache_name: str = 'ratelimit') -> None:
+        """
+        :param backend: 'uwsgi', 'sqlite' или 'auto' (кэш uWSGI, если он настроен, иначе SQLite),
+        db_path: файл SQLite для корзин, cache_name: имя кэша uWSGI
+        """
+        if backend == 'auto':
+            backend = 'uwsgi' if uwsgi is not None and uwsgi.opt.get('cache2') else 'sqlite'
+        self.buckets = UwsgiBuckets(cache_name) if backend == 'uwsgi' else SQLiteBuckets(db_path)
+
+    def allow(self, key: str, limit: tuple[int, float]) -> bool:
+        """
+        Забирает токен из корзины ключа
+
+        :param key: ключ корзины, limit: (кол-во запросов, за сколько секунд)
+        :return: True, если запрос укладывается в лимит
+        """
+        capacity, period = limit
+        try:
+            return self.buckets.take(key, capacity, period)
+        except sqlite3.Error:
+            # недоступность хранилища лимитов не должна закрывать вход на сайт
+            return True
@@ -0,0 +1,118 @@
+"""
+Компактные типизированные строки результата запроса вместо sqlite3.Row.
+
+Для каждого набора колонок запроса один раз создается класс-кортеж со __slots__ = ()
+(на базе namedtuple), поэтому строка - это один кортеж без отдельного объекта-обертки,
+а обращение к колонке по имени (book.code в шаблонах Jinja) - обычный атрибут класса,
+без исключения AttributeError и поиска по ключу, как у sqlite3.Row.
+
+Совместимость с sqlite3.Row сохранена: доступ по индексу (row[0]), по имени колонки
+(row['code']), keys(), распаковка и проверка на пустоту.
+
+Сравнение с sqlite3.Row (память и время отрисовки таблицы):
+    python records.py [кол-во строк]
+"""
+import sqlite3
+
+from collections import namedtuple
+from typing import Any
+
+
+class Record:
+    """Примесь к классам строк: доступ к колонке по имени через row['name']"""
+    __slots__ = ()
+
+    _index: dict[str, int] = {}
+
+    def __getitem__(self, key: int | slice | str) -> Any:
+        if key.__class__ is str:
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def keys(self) -> list[str]:
+        return list(self._index)
+
+
+# классы строк по набору имен колонок запроса
+_classes: dict[tuple[str, ...], type] = {}
+# последний использованный cursor.description и его класс - быстрый путь для fetchall()
+_last: tuple[Any, type | None] = (None, None)
+
+
+def record_class(columns: tuple[str, ...]) -> type:
+    """
+    Возвращает (создает при первом обращении) класс строки для набора колонок
+
+    :param columns: имена колонок в порядке их следования в запросе
+    :return: класс-кортеж со __slots__ и атрибутами по именам колонок
+    """
+    cls = _classes.get(columns)
+    if cls is None:
+        # rename=True: имена, недопустимые для атрибутов (например, "count(*)"),
+        # заменяются на _0, _1..., но остаются доступны через row['count(*)']
+        base = namedtuple('Row', columns, rename=True)
+        cls = type('Record', (Record, base), {
+            '__slots__': (),
+            '_index': {name: i for i, name in enumerate(columns)},
+        })
+        _classes[columns] = cls
+    return cls
+
+
+def record_factory(cursor: sqlite3.Cursor, row: tuple) -> tuple:
+    """
+    Фабрика строк для sqlite3 (conn.row_factory = record_factory)
+
+    :param cursor: курсор, выполнивший запрос, row: кортеж значений строки
+    :return: экземпляр класса строки для колонок этого запроса
+    """
+    global _last
+    description = cursor.description
+    last_description, cls = _last
+    if description is not last_description:
+        cls = record_class(tuple(col[0] for col in description))
+        _last = (description, cls)
+    return tuple.__new__(cls, row)
+
+
+def _benchmark(rows: int) -> None:
+    """Сравнивает sqlite3.Row и record_factory на выборке и отрисовке таблицы каталога"""
+    import time
+    import tracemalloc
+
+    from jinja2 import Environment
+
+    columns = ('code', 'title', 'author', 'genre', 'year', 'owner', 'dt_new')
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE books({', '.join(columns)})")
+    conn.executemany(f"INSERT INTO books VALUES({', '.join('?' * len(columns))})",
+                     ((10000 + i, f'Книга {i}', f'Автор {i % 500}', 'Проза', 1900 + i % 120,
+                       f'user{i % 300}@tele2.ru', '2023-04-01 12:00:00') for i in range(rows)))
+    template = Environment().from_string(
+        '{% for book in books %}<tr>'
+        + ''.join(f'<td>{{{{ book.{col} }}}}</td>' for col in columns)
+        + '</tr>{% endfor %}')
+
+    for name, factory in (('sqlite3.Row', sqlite3.Row), ('record_factory', record_factory)):
+        conn.row_factory = factory
+        start = time.perf_counter()
+        books = conn.execute('SELECT * FROM books').fetchall()
+        fetch_time = time.perf_counter() - start
+        del books
+        # память замеряется отдельным проходом, т.к. tracemalloc искажает время выборки
+        tracemalloc.start()
+        books = conn.execute('SELECT * FROM books').fetchall()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        template.render(books=books)
+        render_time = time.perf_counter() - start
+        print(f'{name:>15}: выборка {fetch_time * 1000:8.1f} мс, память {memory / 1024:9.1f} КБ, '
+              f'отрисовка {render_time * 1000:8.1f} мс ({rows} строк)')
+    conn.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
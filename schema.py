@@ -0,0 +1,52 @@
+"""
+Дополнения к схеме БД, нужные подсистемам приложения.
+
+Основная схема (таблицы, представления) ведется в самой БД, здесь - только объекты,
+которые создают подсистемы приложения. Все выражения идемпотентны (IF NOT EXISTS)
+и выполняются один раз на процесс для каждого файла БД при первом соединении.
+"""
+import sqlite3
+
+# dt_delete открытой (не удаленной, не закрытой) записи
+NOT_DELETED = '9999-12-31 00:00:00'
+
+SCHEMA: list[str] = [
+    # счетчик кодов книг, из которого воркеры резервируют блоки кодов, и граница диапазона полки (см. codes.py)
+    """CREATE TABLE IF NOT EXISTS code_seq (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        next_value INTEGER NOT NULL,
+        max_value INTEGER NOT NULL
+    )""",
+    # коды до 10000 (5 цифр) назначены старым книгам, новые начинаются с 10000 + контрольная цифра;
+    # исходная БД - полка 0, ее номера заканчиваются перед диапазоном полки 1 (codes.CODE_SPAN)
+    "INSERT OR IGNORE INTO code_seq (id, next_value, max_value) VALUES (1, 10000, 1000000)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_books_code ON books (code)",
+    # очередь обращений от новых к старым: открытые (частичный индекс - только открытые, их мало)
+    # и по пользователю
+    f"CREATE INDEX IF NOT EXISTS idx_feedbacks_open ON feedbacks (id) WHERE dt_delete = '{NOT_DELETED}'",
+    "CREATE INDEX IF NOT EXISTS idx_feedbacks_user ON feedbacks (user_id, id)",
+    # коды подтверждения входа: хранятся на сервере (в виде хэша), а не в cookie сессии
+    """CREATE TABLE IF NOT EXISTS verify_codes (
+        email TEXT PRIMARY KEY,
+        code_hash TEXT NOT NULL,
+        dt_expire TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0
+    )""",
+]
+
+# файлы БД, для которых схема уже проверена в этом процессе
+_applied: set[str] = set()
+
+
+def ensure_schema(conn: sqlite3.Connection, db_path: str) -> None:
+    """
+    Создает недостающие объекты схемы БД (один раз на процесс для каждого файла БД)
+
+    :param conn: соединение с БД на чтение и запись, db_path: путь к файлу БД
+    """
+    if db_path in _applied:
+        return
+    with conn:
+        for sql in SCHEMA:
+            conn.execute(sql)
+    _applied.add(db_path)
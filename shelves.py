@@ -0,0 +1,163 @@
+"""
+Полки "Книжного перекрестка" в разных офисах: у каждой полки свой файл БД.
+
+SHELVES в конфигурации - словарь {имя полки: путь к файлу БД}, например
+    SHELVES = {'Москва': 'data/ssc-books.db', 'Новосибирск': 'data/ssc-books-nsk.db'}
+Пользователь выбирает полку на главной странице, выбор хранится в сессии, и все запросы
+к БД (get_db/get_db_ro) идут в файл выбранной полки. Запись на одной полке не блокирует
+другие: у каждого файла своя блокировка SQLite, и файлы можно разнести по разным узлам.
+
+Если SHELVES не задан, полка одна - DB_PATH, и приложение работает как раньше.
+
+Пользователь регистрируется на полке при первом обращении к ней. Файл БД новой полки
+создается из БД существующей полки: копируются схема, справочники (меню, правила, жанры)
+и администраторы (иначе на новой полке некому закрывать обращения), а счетчик кодов книг
+начинается с диапазона полки с номером N (см. codes.py):
+    python shelves.py create data/ssc-books.db data/ssc-books-nsk.db 1
+Проверка, что у полок из SHELVES разные диапазоны кодов книг:
+    python shelves.py check
+
+Общий каталог свободных книг всех полок собирается параллельными запросами
+к файлам полок в пуле потоков (sqlite3 отпускает GIL на время выполнения запроса).
+"""
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from urllib.request import pathname2url
+
+import queries
+from codes import CODE_SPAN, first_number, max_number
+from schema import ensure_schema
+
+# справочники, общие для всех полок (копируются в БД новой полки)
+SHARED_TABLES = ('mainmenu', 'rules', 'genres')
+
+_pool: ThreadPoolExecutor | None = None
+_pool_pid: int | None = None
+
+
+def _executor(workers: int) -> ThreadPoolExecutor:
+    # пул создается в воркере: потоки master-процесса не переживают fork
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shelves')
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _available_books(connect: Callable[[str], sqlite3.Connection], db_path: str) -> list:
+    conn = connect(db_path)
+    try:
+        return queries.fetchall(conn.cursor(), 'available_books')
+    finally:
+        conn.close()
+
+
+def get_catalog(shelves: dict[str, str],
+                connect: Callable[[str], sqlite3.Connection]) -> list[tuple[str, list | str]]:
+    """
+    Возвращает свободные книги всех полок
+
+    :param shelves: {имя полки: путь к файлу БД},
+    connect: функция, открывающая соединение на чтение по пути к файлу БД
+    :return: список (имя полки, список книг или описание ошибки, если полка недоступна)
+    """
+    # каждый поток открывает и закрывает свое соединение: соединения sqlite3 не передаются между потоками
+    futures = [(name, _executor(len(shelves)).submit(_available_books, connect, db_path))
+               for name, db_path in shelves.items()]
+    catalog = []
+    for name, future in futures:
+        try:
+            catalog.append((name, future.result()))
+        except sqlite3.Error as err:
+            catalog.append((name, str(err)))
+    return catalog
+
+
+def create_shelf(src_path: str, db_path: str, shelf_no: int) -> None:
+    """
+    Создает файл БД новой полки
+
+    :param src_path: БД существующей полки (источник схемы, справочников и администраторов),
+    db_path: файл БД новой полки, shelf_no: номер полки (задает диапазон кодов книг, > 0)
+    """
+    if shelf_no <= 0:
+        raise ValueError('номер новой полки должен быть больше 0 (0 - исходная БД)')
+    if os.path.exists(db_path):
+        raise FileExistsError(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute('ATTACH DATABASE ? AS src', (src_path,))
+            # сначала таблицы, затем индексы, представления и триггеры - в порядке создания в источнике
+            objects = conn.execute("""
+                SELECT sql FROM src.sqlite_master
+                WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 WHEN 'view' THEN 2 ELSE 3 END,
+                rowid""").fetchall()
+            for (sql,) in objects:
+                conn.execute(sql)
+            for table in SHARED_TABLES:
+                conn.execute(f'INSERT INTO main.{table} SELECT * FROM src.{table}')
+            # остальные пользователи зарегистрируются на полке сами при первом обращении
+            conn.execute('INSERT INTO main.users (email, is_admin) '
+                         'SELECT email, is_admin FROM src.users WHERE is_admin = 1 AND is_on = 1')
+        conn.execute('DETACH DATABASE src')
+        ensure_schema(conn, db_path)
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO code_seq (id, next_value, max_value) VALUES (1, ?, ?)',
+                         (first_number(shelf_no), max_number(shelf_no)))
+    finally:
+        conn.close()
+
+
+def check_shelves(shelves: dict[str, str]) -> list[str]:
+    """
+    Проверяет, что счетчики кодов книг полок находятся в разных диапазонах
+
+    :param shelves: {имя полки: путь к файлу БД}
+    :return: список описаний ошибок (пустой - диапазоны не пересекаются)
+    """
+    errors = []
+    owners: dict[int, str] = {}
+    for name, db_path in shelves.items():
+        try:
+            conn = sqlite3.connect(f'file:{pathname2url(os.path.abspath(db_path))}?mode=ro', uri=True)
+            try:
+                max_value = conn.execute('SELECT max_value FROM code_seq WHERE id = 1').fetchone()[0]
+            finally:
+                conn.close()
+        except (sqlite3.Error, TypeError) as err:
+            errors.append(f'полка "{name}" ({db_path}): не удалось прочитать счетчик кодов - {err}')
+            continue
+        # граница диапазона определяет номер полки (счетчик исчерпанной полки уже стоит на границе)
+        shelf_no = max_value // CODE_SPAN - 1
+        if shelf_no in owners:
+            errors.append(f'у полок "{owners[shelf_no]}" и "{name}" общий диапазон кодов книг №{shelf_no}')
+        owners.setdefault(shelf_no, name)
+    return errors
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Полки в офисах: создание БД полки и проверка диапазонов кодов')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='создать файл БД новой полки')
+    create.add_argument('src', help='БД существующей полки (источник схемы, справочников и администраторов)')
+    create.add_argument('db', help='файл БД новой полки')
+    create.add_argument('number', type=int, help='номер полки (1, 2, ...), задает диапазон кодов книг')
+    commands.add_parser('check', help='проверить диапазоны кодов книг полок из SHELVES')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        create_shelf(args.src, args.db, args.number)
+        print(f'Создана БД полки {args.db}, коды книг с номера {first_number(args.number)}')
+    else:
+        import conf.config as config
+
+        problems = check_shelves(getattr(config, 'SHELVES', {}))
+        for problem in problems:
+            print(problem)
+        raise SystemExit(1 if problems else 0)
@@ -0,0 +1,227 @@
+"""
+Нагрузочный прогон выдачи, возврата и подписки на книги несколькими процессами.
+
+Каждый процесс поднимает приложение (как воркер uWSGI) и через тестовый клиент Flask
+выполняет случайные операции от имени своих пользователей над копией БД. После прогона
+проверяются инварианты, которые обеспечивают запросы takeBook и subscribeBook:
+    - книга выдана не более чем одному читателю;
+    - у читателя не более одной невозвращенной книги;
+    - у читателя не более одной открытой подписки на книгу.
+
+Запуск:
+    python stress.py [--db data/ssc-books.db] [--workers 8] [--users 40] [--ops 200] [--seed 1]
+
+По умолчанию прогон идет на временной копии БД; --in-place - на самой БД (только для тестовой!).
+"""
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+# операции и их относительная частота
+OPERATIONS = {'take': 4, 'return': 3, 'subscribe': 2, 'unsubscribe': 1}
+
+INVARIANTS = {
+    'книга выдана нескольким читателям': """
+        SELECT book_id, COUNT(*) FROM forms
+        WHERE dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime')
+        GROUP BY book_id HAVING COUNT(*) > 1""",
+    'у читателя несколько невозвращенных книг': """
+        SELECT user_id, COUNT(*) FROM forms
+        WHERE dt_take <= datetime('now', 'localtime') AND dt_return > datetime('now', 'localtime')
+        GROUP BY user_id HAVING COUNT(*) > 1""",
+    'несколько открытых подписок читателя на книгу': """
+        SELECT user_id, book_id, COUNT(*) FROM subscriptions
+        WHERE dt_new <= datetime('now', 'localtime') AND dt_delete > datetime('now', 'localtime')
+        GROUP BY user_id, book_id HAVING COUNT(*) > 1""",
+}
+
+
+def prepare(db_path: str, users: int) -> tuple[list[str], list[tuple[int, int]]]:
+    """
+    Создает пользователей прогона и возвращает их адреса и список активных книг
+
+    :param db_path: путь к БД прогона, users: кол-во пользователей
+    :return: (адреса пользователей, список (id книги, код книги))
+    """
+    emails = [f'stress{i}@tele2.ru' for i in range(users)]
+    conn = sqlite3.connect(db_path)
+    with conn:
+        for email in emails:
+            conn.execute('INSERT INTO users(email) SELECT ? WHERE NOT EXISTS '
+                         '(SELECT 1 FROM users WHERE email = ?)', (email, email))
+    books = conn.execute('SELECT id, code FROM books WHERE is_on = 1').fetchall()
+    conn.close()
+    return emails, books
+
+
+def worker(args: tuple) -> dict:
+    """
+    Выполняет операции от имени пользователей одного процесса
+
+    :param args: (путь к БД, адреса пользователей, книги, кол-во операций, seed, каталог статистики запросов)
+    :return: счетчики операций, задержки и статистика SQL-запросов процесса
+    """
+    db_path, emails, books, ops, seed, stats_dir = args
+    module = importlib.import_module('flask-books')
+    app = module.application
+    # SHELVES сбрасывается: иначе запросы ушли бы в файлы полок, а не в БД прогона;
+    # статистика запросов пишется во временный каталог, а не в logs/ приложения
+    app.config.update(DB_PATH=db_path, SHELVES={}, DB_DUMP=False, TESTING=True, MAIL_SUPPRESS_SEND=True,
+                      PROFILING=False, QUERY_STATS_DIR=stats_dir, QUERY_STATS_INTERVAL=3600)
+    # отказы по правилам выдачи пишутся в лог как ошибки, при прогоне они ожидаемы
+    app.logger.setLevel(logging.CRITICAL)
+    client = app.test_client()
+    rnd = random.Random(seed)
+    names, weights = zip(*OPERATIONS.items())
+    result = {'ok': {}, 'rejected': {}, 'errors': {}, 'latency': [], 'messages': []}
+    # книги, взятые пользователями процесса: возвращается чаще своя книга, а не случайная
+    taken = {}
+
+    for _ in range(ops):
+        email = rnd.choice(emails)
+        book_id, book_code = rnd.choice(books)
+        op = rnd.choices(names, weights)[0]
+        with client.session_transaction() as session:
+            session.clear()
+            session['logged_in'] = True
+            session['userLogged'] = email
+        start = time.perf_counter()
+        if op == 'take':
+            response = client.post('/take_book', data={'book_code': str(book_code)})
+        elif op == 'return':
+            # возврат своей книги, выданной в этом прогоне, правилами отклоняться не должен
+            own = email in taken
+            book_code = taken.get(email, book_code)
+            response = client.get(f'/return_book/{book_code}')
+        elif op == 'subscribe':
+            response = client.get(f'/subscribe_book/{book_id}')
+        else:
+            response = client.get(f'/unsubscribe_book/{book_id}')
+        result['latency'].append(time.perf_counter() - start)
+        with client.session_transaction() as session:
+            flashes = session.get('_flashes', [])
+        categories = {category for category, _ in flashes}
+        if response.status_code >= 500 or any('locked' in msg or 'database' in msg for _, msg in flashes):
+            outcome = 'errors'
+            result['messages'].extend(msg for category, msg in flashes if category == 'error')
+        elif 'success' in categories:
+            outcome = 'ok'
+            if op == 'take':
+                taken[email] = book_code
+            elif op == 'return':
+                taken.pop(email, None)
+        elif op == 'return' and own:
+            outcome = 'errors'
+            result['messages'].append('возврат книги, выданной в этом прогоне, отклонен')
+        else:
+            outcome = 'rejected'
+        result[outcome][op] = result[outcome].get(op, 0) + 1
+    result['queries'] = module.queries.stats.as_dict()
+    return result
+
+
+def check_invariants(db_path: str) -> dict[str, list]:
+    """Возвращает нарушения инвариантов (пустой список - инвариант соблюден)"""
+    conn = sqlite3.connect(db_path)
+    violations = {name: conn.execute(sql).fetchall() for name, sql in INVARIANTS.items()}
+    conn.close()
+    return violations
+
+
+def report(results: list[dict], elapsed: float, violations: dict[str, list]) -> bool:
+    """
+    Печатает пропускную способность, доли ошибок и результат проверки инвариантов
+
+    :return: True, если инварианты соблюдены и хотя бы один возврат книги выполнен
+    """
+    total = {outcome: {} for outcome in ('ok', 'rejected', 'errors')}
+    latency = sorted(x for r in results for x in r['latency'])
+    for r in results:
+        for outcome in total:
+            for op, count in r[outcome].items():
+                total[outcome][op] = total[outcome][op] + count if op in total[outcome] else count
+    ops = len(latency)
+    print(f'Операций: {ops} за {elapsed:.2f} с, {ops / elapsed:.1f} оп/с, '
+          f'задержка p50 {latency[ops // 2] * 1000:.1f} мс, p95 {latency[int(ops * 0.95)] * 1000:.1f} мс, '
+          f'max {latency[-1] * 1000:.1f} мс')
+    for op in OPERATIONS:
+        ok, rejected, errors = (total[outcome].get(op, 0) for outcome in ('ok', 'rejected', 'errors'))
+        count = ok + rejected + errors
+        if count:
+            print(f'  {op:>11}: {count:5} всего, успешно {ok}, отклонено правилами {rejected}, '
+                  f'ошибок {errors} ({errors / count:.1%})')
+    messages = {msg for r in results for msg in r['messages']}
+    for msg in list(messages)[:5]:
+        print(f'  ошибка: {msg}')
+
+    queries = {}
+    for r in results:
+        for name, s in r['queries'].items():
+            acc = queries.setdefault(name, {'calls': 0, 'time': 0.0})
+            acc['calls'] += s['calls']
+            acc['time'] += s['time']
+    print('Самые долгие запросы:')
+    for name, s in sorted(queries.items(), key=lambda item: item[1]['time'], reverse=True)[:5]:
+        print(f"  {name}: вызовов {s['calls']}, в среднем {s['time'] * 1000 / s['calls']:.3f} мс")
+
+    ok = True
+    # без возвратов книги быстро оказываются на руках, и гонка выдачи дальше не проверяется
+    returns = sum(total[outcome].get('return', 0) for outcome in total)
+    if returns and not total['ok'].get('return', 0):
+        print(f'Ни один из {returns} возвратов не выполнен: прогон не проверяет выдачу освобождаемых книг')
+        ok = False
+    for name, rows in violations.items():
+        print(f"Инвариант '{name}': {'НАРУШЕН ' + str(rows[:10]) if rows else 'соблюден'}")
+        ok = ok and not rows
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон выдачи, возврата и подписки на книги')
+    parser.add_argument('--db', default=os.path.join('data/', 'ssc-books.db'), help='путь к БД')
+    parser.add_argument('--in-place', action='store_true', help='работать на самой БД, а не на копии')
+    parser.add_argument('--workers', type=int, default=8, help='кол-во процессов')
+    parser.add_argument('--users', type=int, default=40, help='кол-во пользователей')
+    parser.add_argument('--ops', type=int, default=200, help='кол-во операций на процесс')
+    parser.add_argument('--seed', type=int, default=1, help='начальное значение генератора случайных чисел')
+    args = parser.parse_args()
+
+    # во временном каталоге - копия БД и статистика запросов воркеров
+    tmp_dir = tempfile.mkdtemp(prefix='ssc-books-stress-')
+    stats_dir = os.path.join(tmp_dir, 'query_stats')
+    db_path = args.db
+    if not args.in_place:
+        db_path = os.path.join(tmp_dir, 'ssc-books.db')
+        src, dst = sqlite3.connect(args.db), sqlite3.connect(db_path)
+        src.backup(dst)
+        src.close()
+        dst.close()
+    try:
+        emails, books = prepare(db_path, args.users)
+        if not books:
+            print('В БД нет активных книг')
+            return 1
+        # пользователи делятся между процессами, как сессии между воркерами uWSGI
+        tasks = [(db_path, emails[i::args.workers] or emails, books, args.ops, args.seed + i, stats_dir)
+                 for i in range(args.workers)]
+        # приложение создается один раз до fork (как в uWSGI с lazy-apps = false),
+        # воркеры получают уже загруженный модуль
+        importlib.import_module('flask-books')
+        start = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(args.workers) as pool:
+            results = pool.map(worker, tasks)
+        elapsed = time.perf_counter() - start
+        return 0 if report(results, elapsed, check_invariants(db_path)) else 1
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
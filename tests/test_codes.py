@@ -0,0 +1,44 @@
+import sqlite3
+import unittest
+
+from codes import CodeAllocator, first_number, is_valid_code, max_number
+from records import record_factory
+from schema import SCHEMA
+
+
+def make_db(next_value: int, max_value: int) -> sqlite3.Connection:
+    """БД в памяти только со счетчиком кодов книг"""
+    db = sqlite3.connect(':memory:')
+    db.row_factory = record_factory
+    db.execute(SCHEMA[0])
+    db.execute('INSERT INTO code_seq (id, next_value, max_value) VALUES (1, ?, ?)', (next_value, max_value))
+    db.commit()
+    return db
+
+
+class CodeRangeTest(unittest.TestCase):
+    def test_shelf_ranges_do_not_overlap(self):
+        self.assertEqual(max_number(0), first_number(1))
+        self.assertEqual(max_number(1), first_number(2))
+
+    def test_last_block_of_range(self):
+        db = make_db(max_number(1) - 4, max_number(1))
+        allocator = CodeAllocator(block_size=2)
+        codes = [allocator.allocate(db) for _ in range(4)]
+        self.assertEqual(len(set(codes)), 4)
+        self.assertTrue(all(is_valid_code(str(code)) for code in codes))
+        self.assertEqual(codes[-1] // 10, max_number(1) - 1)
+
+    def test_block_crossing_boundary_is_rejected(self):
+        db = make_db(max_number(1) - 3, max_number(1))
+        allocator = CodeAllocator(block_size=2)
+        allocator.allocate(db)
+        allocator.allocate(db)
+        with self.assertRaises(sqlite3.DatabaseError):
+            allocator.allocate(db)
+        # счетчик не сдвигается за границу: номера следующей полки остаются свободными
+        self.assertEqual(db.execute('SELECT next_value FROM code_seq').fetchone()[0], max_number(1) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()